@@ -0,0 +1,245 @@
+"""Capabilities of connected TVPaint build.
+
+Some limits of TVPaint are not documented and differ between versions, e.g.
+number of color groups. Capabilities are probed once per TVPaint build after
+the client connects and the result is cached on disk, so next launches of the
+same build don't have to probe again.
+
+Probing only queries TVPaint and never writes to the opened project.
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+try:
+    from ayon_core.lib import get_launcher_local_dir
+except ImportError:
+    # Older ayon-core versions
+    from ayon_core.lib import get_ayon_appdirs as get_launcher_local_dir
+
+log = logging.getLogger(__name__)
+
+# Change when probing logic changes to invalidate cached values
+CAPABILITIES_VERSION = 3
+
+# Values used when capabilities were not probed (yet)
+# - 26 groups is maximum possible in 11.7
+#   ref: https://www.tvpaint.com/forum/viewtopic.php?t=13880
+DEFAULT_CAPABILITIES = {
+    "group_count": 26,
+    "exposure_navigation": False,
+}
+
+# Upper limit of color groups that is tested during probing
+_PROBE_MAX_GROUPS = 256
+
+
+def get_capabilities_cache_filepath():
+    """Path to json file where probed capabilities are cached.
+
+    Returns:
+        str: Path to capabilities cache file.
+    """
+    return os.path.join(
+        get_launcher_local_dir("addons", "tvpaint"),
+        "capabilities.json"
+    )
+
+
+def _read_capabilities_cache():
+    filepath = get_capabilities_cache_filepath()
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath, "r") as stream:
+            data = json.load(stream)
+    except Exception:
+        log.warning("Failed to read TVPaint capabilities cache.")
+        return {}
+
+    if data.get("version") != CAPABILITIES_VERSION:
+        return {}
+    return data.get("builds") or {}
+
+
+def _write_capabilities_cache(builds):
+    filepath = get_capabilities_cache_filepath()
+    dirpath = os.path.dirname(filepath)
+    try:
+        os.makedirs(dirpath, exist_ok=True)
+        with open(filepath, "w") as stream:
+            json.dump(
+                {"version": CAPABILITIES_VERSION, "builds": builds},
+                stream,
+                indent=4
+            )
+    except Exception:
+        log.warning(
+            "Failed to write TVPaint capabilities cache.", exc_info=True
+        )
+
+
+def _get_build_key(version_info):
+    return hashlib.sha1(version_info.encode("utf-8")).hexdigest()
+
+
+def _create_tmp_filepath():
+    tmp_file = tempfile.NamedTemporaryFile(
+        mode="w", prefix="a_tvp_", suffix=".txt", delete=False
+    )
+    tmp_file.close()
+    return tmp_file.name.replace("\\", "/")
+
+
+def _read_tmp_lines(filepath):
+    with open(filepath, "r") as stream:
+        data = stream.read()
+    os.remove(filepath)
+    return [
+        line.strip()
+        for line in data.split("\n")
+        if line.strip()
+    ]
+
+
+def _probe_group_count(communicator):
+    output_filepath = _create_tmp_filepath()
+    george_script_lines = (
+        "output_path = \"{}\"".format(output_filepath),
+        "FOR idx = 1 TO {}".format(_PROBE_MAX_GROUPS),
+        "tv_layercolor \"getcolor\" 0 idx",
+        "line = idx'|'result",
+        "tv_writetextfile \"strict\" \"append\" '\"'output_path'\"' line",
+        "END",
+    )
+    communicator.execute_george_through_file("\n".join(george_script_lines))
+
+    group_count = None
+    for line in _read_tmp_lines(output_filepath):
+        idx, _, result = line.partition("|")
+        parts = result.split(" ")
+        # Valid result starts with "<clip id> <group index>"
+        if len(parts) < 2 or parts[1] != idx:
+            break
+        group_count = int(idx)
+    return group_count
+
+
+def _probe_exposure_navigation(communicator):
+    # Store current frame to be able to go back after the probe
+    # - result can't be trusted without a layer, e.g. no project is opened
+    current_frame = communicator.execute_george("tv_layergetimage")
+    if not current_frame:
+        return None
+    available = True
+    for command in ("tv_exposurenext", "tv_exposureprev"):
+        result = communicator.execute_george(command)
+        if result is None:
+            available = None
+            break
+        if result.lower().startswith("error"):
+            available = False
+            break
+
+    communicator.execute_george("tv_layerimage {}".format(current_frame))
+    return available
+
+
+# Functions probing capabilities, result 'None' means the probe failed
+_PROBE_FUNCS = {
+    "group_count": _probe_group_count,
+    "exposure_navigation": _probe_exposure_navigation,
+}
+
+
+def probe_capabilities(communicator):
+    """Probe capabilities of connected TVPaint.
+
+    Result is cached on disk per TVPaint build and probing is skipped if
+    the build was already probed. Only values which were probed
+    successfully are cached, missing values are probed on next launch.
+
+    Args:
+        communicator (BaseCommunicator): Communicator connected to TVPaint.
+
+    Returns:
+        dict[str, Any]: Capabilities of TVPaint build.
+    """
+    version_info = communicator.execute_george("tv_version")
+    # Host was probably closed
+    if version_info is None:
+        return dict(DEFAULT_CAPABILITIES)
+
+    builds = _read_capabilities_cache()
+    build_key = _get_build_key(version_info)
+    build_data = builds.get(build_key) or {}
+    cached = {
+        key: value
+        for key, value in (build_data.get("capabilities") or {}).items()
+        if key in DEFAULT_CAPABILITIES and value is not None
+    }
+
+    capabilities = dict(DEFAULT_CAPABILITIES)
+    capabilities.update(cached)
+    missing_keys = [
+        key
+        for key in _PROBE_FUNCS
+        if key not in cached
+    ]
+    if not missing_keys:
+        log.debug("Using cached TVPaint capabilities: {}".format(
+            capabilities
+        ))
+        return capabilities
+
+    log.info("Probing capabilities of TVPaint \"{}\"".format(version_info))
+    probed = {}
+    for key in missing_keys:
+        try:
+            value = _PROBE_FUNCS[key](communicator)
+        except Exception:
+            log.warning(
+                "Failed to probe TVPaint capability \"{}\".".format(key),
+                exc_info=True
+            )
+            continue
+        # Probe did not give result, e.g. no project is opened
+        if value is not None:
+            probed[key] = value
+
+    if probed:
+        cached.update(probed)
+        capabilities.update(probed)
+        builds[build_key] = {
+            "version_info": version_info,
+            "capabilities": cached,
+        }
+        _write_capabilities_cache(builds)
+
+    log.debug("TVPaint capabilities: {}".format(capabilities))
+    return capabilities
+
+
+def get_capabilities(communicator=None):
+    """Capabilities of TVPaint that is connected through communicator.
+
+    Default values are returned if capabilities were not probed.
+
+    Args:
+        communicator (BaseCommunicator): Communicator connected to TVPaint.
+            Current communicator is used if not passed.
+
+    Returns:
+        dict[str, Any]: Capabilities of TVPaint build.
+    """
+    if communicator is None:
+        from .communication_server import CommunicationWrapper
+
+        communicator = CommunicationWrapper.communicator
+
+    capabilities = getattr(communicator, "capabilities", None)
+    if capabilities is None:
+        return dict(DEFAULT_CAPABILITIES)
+    return capabilities
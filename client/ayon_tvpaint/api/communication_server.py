@@ -24,6 +24,8 @@ from aiohttp_json_rpc.exceptions import RpcError
 from ayon_core.lib import emit_event
 from ayon_tvpaint.tvpaint_plugin import get_plugin_files_path
 
+from .capabilities import probe_capabilities
+
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
@@ -452,11 +454,15 @@ class MainThreadItem:
 
 
 class BaseCommunicator:
+    # Probe capabilities of TVPaint build when client connects
+    probe_capabilities_on_connect = True
+
     def __init__(self):
         self.process = None
         self.websocket_server = None
         self.websocket_rpc = None
         self.exit_code = None
+        self.capabilities = None
         self._connected_client = None
 
     @property
@@ -742,6 +748,8 @@ class BaseCommunicator:
 
     def _on_client_connect(self):
         self._initial_textfile_write()
+        if self.probe_capabilities_on_connect:
+            self.capabilities = probe_capabilities(self)
 
     def _initial_textfile_write(self):
         """Show popup about Write to file at start of TVPaint."""
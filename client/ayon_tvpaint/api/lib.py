@@ -3,6 +3,7 @@ import logging
 import tempfile
 
 from .communication_server import CommunicationWrapper
+from .capabilities import get_capabilities
 
 log = logging.getLogger(__name__)
 
@@ -202,13 +203,16 @@ def get_groups_data(communicator=None):
     output_file.close()
 
     output_filepath = output_file.name.replace("\\", "/")
+    # Maximum possible number of groups is probed per TVPaint build
+    # - ATM 26 groups is maximum possible in 11.7
+    #   ref: https://www.tvpaint.com/forum/viewtopic.php?t=13880
+    group_count = get_capabilities(communicator)["group_count"]
     george_script_lines = (
         # Variable containing full path to output file
         "output_path = \"{}\"".format(output_filepath),
         "empty = 0",
-        # Loop over 26 groups which is ATM maximum possible (in 11.7)
-        # - ref: https://www.tvpaint.com/forum/viewtopic.php?t=13880
-        "FOR idx = 1 TO 26",
+        # Loop over all possible groups
+        "FOR idx = 1 TO {}".format(group_count),
         # Receive information about groups
         "tv_layercolor \"getcolor\" 0 idx",
         "PARSE result clip_id group_index c_red c_green c_blue group_name",
@@ -308,6 +312,63 @@ def get_layers_pre_post_behavior(layer_ids, communicator=None):
     return output
 
 
+def _get_exposure_frames_george_lines(
+    first_frame, last_frame, use_navigation=False
+):
+    """George script lines adding exposure frames of current layer to 'line'.
+
+    Each exposure frame is appended to variable 'line' with '|' prefix.
+
+    With navigation only exposure heads are visited using
+    'tv_exposurenext' which is much faster than checking each frame of
+    layer. Navigation is not available in all TVPaint builds.
+
+    Args:
+        first_frame (int): First frame where to look for exposure frames.
+        last_frame (int): Last frame where to look for exposure frames.
+        use_navigation (bool): Use exposure navigation commands.
+
+    Returns:
+        list[str]: George script lines.
+    """
+    if not use_navigation:
+        return [
+            "frame = {}".format(first_frame),
+            "WHILE (frame <= {})".format(last_frame),
+            "tv_exposureinfo frame",
+            "exposure = result",
+            "IF (CMP(exposure, \"Head\") == 1)",
+            "line = line'|'frame",
+            "END",
+            "frame = frame + 1",
+            "END",
+        ]
+
+    return [
+        "frame = {}".format(first_frame),
+        "tv_layerimage frame",
+        "loop = 1",
+        "WHILE loop",
+        "tv_exposureinfo frame",
+        "exposure = result",
+        "IF (CMP(exposure, \"Head\") == 1)",
+        "line = line'|'frame",
+        "END",
+        "tv_exposurenext",
+        "tv_layergetimage",
+        "next_frame = result",
+        # Stop when navigation did not move forward or is out of range
+        "loop = 0",
+        "IF (next_frame > frame)",
+        "IF (next_frame <= {})".format(last_frame),
+        "loop = 1",
+        "frame = next_frame",
+        "END",
+        "END",
+        "END",
+    ]
+
+
 def get_layers_exposure_frames(layer_ids, layers_data=None, communicator=None):
     """Get exposure frames.
 
@@ -341,9 +402,16 @@ def get_layers_exposure_frames(layer_ids, layers_data=None, communicator=None):
     )
     tmp_file.close()
     tmp_output_path = tmp_file.name.replace("\\", "/")
+    use_navigation = get_capabilities(communicator)["exposure_navigation"]
     george_script_lines = [
         "output_path = \"{}\"".format(tmp_output_path)
     ]
+    if use_navigation:
+        # Navigation changes current frame which is restored at the end
+        george_script_lines.extend([
+            "tv_layergetimage",
+            "orig_frame = result",
+        ])
 
     output = {}
     layer_id_mapping = {}
@@ -359,18 +427,15 @@ def get_layers_exposure_frames(layer_ids, layers_data=None, communicator=None):
             "layer_id = {}".format(layer_id),
             "line = line''layer_id",
             "tv_layerset layer_id",
-            "frame = {}".format(first_frame),
-            "WHILE (frame <= {})".format(last_frame),
-            "tv_exposureinfo frame",
-            "exposure = result",
-            "IF (CMP(exposure, \"Head\") == 1)",
-            "line = line'|'frame",
-            "END",
-            "frame = frame + 1",
-            "END",
+            *_get_exposure_frames_george_lines(
+                first_frame, last_frame, use_navigation
+            ),
             "tv_writetextfile \"strict\" \"append\" '\"'output_path'\"' line"
         ])
 
+    if use_navigation:
+        george_script_lines.append("tv_layerimage orig_frame")
+
     execute_george_through_file("\n".join(george_script_lines), communicator)
 
     with open(tmp_output_path, "r") as stream:
@@ -424,24 +489,18 @@ def get_exposure_frames(
     )
     tmp_file.close()
     tmp_output_path = tmp_file.name.replace("\\", "/")
+    use_navigation = get_capabilities(communicator)["exposure_navigation"]
     george_script_lines = [
         "tv_layerset {}".format(layer_id),
         "output_path = \"{}\"".format(tmp_output_path),
-        "output = \"\"",
-        "frame = {}".format(first_frame),
-        "WHILE (frame <= {})".format(last_frame),
-        "tv_exposureinfo frame",
-        "exposure = result",
-        "IF (CMP(exposure, \"Head\") == 1)",
-        "IF (CMP(output, \"\") == 1)",
-        "output = output''frame",
-        "ELSE",
-        "output = output'|'frame",
-        "END",
-        "END",
-        "frame = frame + 1",
-        "END",
-        "tv_writetextfile \"strict\" \"append\" '\"'output_path'\"' output"
+        "tv_layergetimage",
+        "orig_frame = result",
+        "line = \"\"",
+        *_get_exposure_frames_george_lines(
+            first_frame, last_frame, use_navigation
+        ),
+        "tv_layerimage orig_frame",
+        "tv_writetextfile \"strict\" \"append\" '\"'output_path'\"' line"
     ]
 
     execute_george_through_file("\n".join(george_script_lines), communicator)
@@ -460,7 +519,8 @@ def get_exposure_frames(
     exposure_frames = []
     for line in lines:
         for frame in line.split("|"):
-            exposure_frames.append(int(frame))
+            if frame:
+                exposure_frames.append(int(frame))
     return exposure_frames
 
 
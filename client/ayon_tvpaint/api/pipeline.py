@@ -27,6 +27,7 @@ from .communication_server import CommunicationWrapper, MainThreadItem
 
 log = logging.getLogger(__name__)
 
+_NOT_SET = object()
 
 METADATA_SECTION = "avalon"
 SECTION_NAME_CONTEXT = "context"
@@ -34,7 +35,8 @@ SECTION_NAME_CREATE_CONTEXT = "create_context"
 SECTION_NAME_INSTANCES = "instances"
 SECTION_NAME_CONTAINERS = "containers"
 # Maximum length of metadata chunk string
-# TODO find out the max (500 is safe enough)
+# - fixed value so metadata can be read by all TVPaint builds
+#   (500 is safe on all known versions)
 TVPAINT_CHUNK_LENGTH = 500
 
 """TVPaint's Metadata
@@ -63,6 +65,11 @@ instances=2
 class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
     name = "tvpaint"
 
+    def __init__(self):
+        super().__init__()
+        self._context_cache = None
+        self._current_workfile_cache = _NOT_SET
+
     def install(self):
         """Install TVPaint-specific functionality."""
 
@@ -89,6 +96,7 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
             "workfile.open.after",
             self._on_workfile_open_after
         )
+        register_event_callback("taskChanged", self._on_task_changed)
 
     def get_current_project_name(self):
         """
@@ -96,7 +104,7 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
             Union[str, None]: Current project name.
         """
 
-        return self.get_current_context().get("project_name")
+        return self._get_cached_context().get("project_name")
 
     def get_current_folder_path(self):
         """
@@ -104,7 +112,7 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
             Union[str, None]: Current folder path.
         """
 
-        return self.get_current_context().get("folder_path")
+        return self._get_cached_context().get("folder_path")
 
     def get_current_task_name(self):
         """
@@ -112,10 +120,29 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
             Union[str, None]: Current task name.
         """
 
-        return self.get_current_context().get("task_name")
+        return self._get_cached_context().get("task_name")
 
     def get_current_context(self):
-        context = get_current_workfile_context()
+        return dict(self._get_cached_context())
+
+    def _get_cached_context(self):
+        """Context stored in workfile metadata.
+
+        Reading of metadata requires multiple round-trips to TVPaint so the
+        context is cached. Cache is refreshed when workfile is opened or
+        saved and when current context changes.
+
+        Returns:
+            dict[str, Any]: Cached context.
+        """
+        if self._context_cache is None:
+            self._context_cache = self._read_current_context()
+        return self._context_cache
+
+    def _read_current_context(self):
+        return self._normalize_context(get_current_workfile_context())
+
+    def _normalize_context(self, context):
         if not context:
             return get_global_context()
 
@@ -130,6 +157,18 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
             "task_name": context.get("task")
         }
 
+    def _save_current_context(self, context):
+        """Store context to workfile metadata and to cache."""
+        save_current_workfile_context(context)
+        self._context_cache = self._normalize_context(dict(context))
+
+    def _invalidate_cache(self):
+        self._context_cache = None
+        self._current_workfile_cache = _NOT_SET
+
+    def _on_task_changed(self):
+        self._context_cache = self._read_current_context()
+
     # --- Create ---
     def get_context_data(self):
         return get_workfile_metadata(SECTION_NAME_CREATE_CONTEXT, {})
@@ -149,22 +188,63 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         george_script = "tv_LoadProject '\"'\"{}\"'\"'".format(
             filepath.replace("\\", "/")
         )
-        return execute_george_through_file(george_script)
+        self._invalidate_cache()
+        result = execute_george_through_file(george_script)
+        # Context could be queried while the project was loading
+        self._invalidate_cache()
+        return result
 
     def save_workfile(self, filepath=None):
         if not filepath:
-            filepath = self.get_current_workfile()
+            # Cached path is not used as save target, workfile could be
+            #   opened or saved from TVPaint UI since it was cached
+            filepath = self._revalidate_current_workfile()
         context = get_global_context()
-        save_current_workfile_context(context)
+        self._save_current_context(context)
 
         # Execute george script to save workfile.
         george_script = "tv_SaveProject {}".format(filepath.replace("\\", "/"))
-        return execute_george(george_script)
+        result = execute_george(george_script)
+        # Project may be saved to a different path
+        self._current_workfile_cache = _NOT_SET
+        return result
 
     def work_root(self, session):
         return session["AYON_WORKDIR"]
 
     def get_current_workfile(self):
+        """Path to currently opened workfile.
+
+        Path is cached to avoid a round-trip to TVPaint on each call. Cache
+        is invalidated when a workfile is opened or saved. Path of workfile
+        opened from TVPaint UI is known only after cache invalidation, so
+        the cached path is not used to save workfile.
+
+        Returns:
+            Union[str, None]: Path to workfile or None if project is not
+                saved.
+        """
+        if self._current_workfile_cache is _NOT_SET:
+            self._current_workfile_cache = self._query_current_workfile()
+        return self._current_workfile_cache
+
+    def _revalidate_current_workfile(self):
+        """Query path to current workfile and validate cache with it.
+
+        Cached context is invalidated when the workfile changed since it
+        was cached.
+
+        Returns:
+            Union[str, None]: Path to workfile or None if project is not
+                saved.
+        """
+        current_workfile = self._query_current_workfile()
+        if current_workfile != self._current_workfile_cache:
+            self._invalidate_cache()
+            self._current_workfile_cache = current_workfile
+        return current_workfile
+
+    def _query_current_workfile(self):
         # TVPaint returns a '\' character when no scene is currently opened
         current_workfile = execute_george("tv_GetProjectName")
         if current_workfile == '\\':
@@ -182,6 +262,7 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         return get_containers()
 
     def initial_launch(self):
+        self._invalidate_cache()
         self._set_workfile_attributes()
 
     def _set_workfile_attributes(self):
@@ -197,7 +278,7 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         if not project_name:
             return
 
-        save_current_workfile_context(global_context)
+        self._save_current_context(global_context)
 
         folder_path = global_context.get("folder_path")
         task_name = global_context.get("task_name")
@@ -240,8 +321,9 @@ class TVPaintHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
 
     def _on_workfile_open_after(self):
         # Make sure opened workfile has stored correct context
+        self._invalidate_cache()
         global_context = get_global_context()
-        save_current_workfile_context(global_context)
+        self._save_current_context(global_context)
         communicator = CommunicationWrapper.communicator
         if hasattr(communicator, "execute_in_main_thread"):
             communicator.execute_in_main_thread(
@@ -1,8 +1,56 @@
 import os
+import json
+import math
+import time
+import zlib
+import bisect
+import fnmatch
 import shutil
-import collections
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
 from PIL import Image, ImageDraw
 
+# Possible values of layer's pre and post behavior
+LAYER_BEHAVIORS = ("none", "hold", "repeat", "pingpong")
+# Frame references are calculated with vectorized batch calculation when
+#   number of layers multiplied by number of frames is above this value
+MATRIX_CALCULATION_THRESHOLD = 100000
+# Values in matrix of frame references which are not frames
+# - frame is not covered by layer and does not have a reference
+MATRIX_NOT_COVERED = np.iinfo(np.int64).min
+# - frame is transparent
+MATRIX_TRANSPARENT = MATRIX_NOT_COVERED + 1
+# Default size of decoded images cache used during compositing in MB
+DEFAULT_IMAGE_CACHE_SIZE_MB = 512
+# Default size of partial composites cache used during compositing in MB
+DEFAULT_PREFIX_CACHE_SIZE_MB = 256
+# Compositing jobs are split into chunks of contiguous frames so each
+#   worker process gets multiple chunks
+COMPOSITE_CHUNKS_PER_WORKER = 4
+COMPOSITE_MIN_CHUNK_SIZE = 8
+# Default size limit of composited frames kept between publishes in MB
+DEFAULT_FRAME_CACHE_SIZE_MB = 2048
+# Change when content of composited frames changes to invalidate cache
+FRAME_CACHE_VERSION = 1
+# Change when structure of checkpoint manifest changes
+CHECKPOINT_VERSION = 1
+
+log = logging.getLogger(__name__)
+
 
 def backwards_id_conversion(data_by_layer_id):
     """Convert layer ids to strings from integers."""
@@ -36,245 +84,342 @@ def get_layer_pos_filename_template(range_end, filename_prefix=None, ext=None):
     return get_frame_filename_template(range_end, new_filename_prefix, ext)
 
 
-def _calculate_pre_behavior_copy(
-    range_start, exposure_frames, pre_beh,
-    layer_frame_start, layer_frame_end,
-    output_idx_by_frame_idx
-):
-    """Calculate frames before first exposure frame based on pre behavior.
+class FrameReferences(Mapping):
+    """Frame references of a layer stored as runs of frames.
 
-    Function may skip whole processing if first exposure frame is before
-    layer's first frame. In that case pre behavior does not make sense.
+    Each run is tuple '(start, end, reference)' where all frames from
+    'start' to 'end' (inclusive) reference the same frame. Held exposures
+    are stored as single run so memory grows with number of exposures and
+    not with number of frames.
+
+    Object behaves as read-only dictionary where key is frame index and value
+    is referenced frame index or 'None' for transparent frame.
 
     Args:
-        range_start(int): First frame of range which should be rendered.
-        exposure_frames(list): List of all exposure frames on layer.
-        pre_beh(str): Pre behavior of layer (enum of 4 strings).
-        layer_frame_start(int): First frame of layer.
-        layer_frame_end(int): Last frame of layer.
-        output_idx_by_frame_idx(dict): References to already prepared frames
-            and where result will be stored.
+        runs (Optional[Iterable[tuple[int, int, Union[int, None]]]]): Runs
+            of frames sorted by start frame.
     """
-    # Check if last layer frame is after range end
-    if layer_frame_start < range_start:
-        return
+    def __init__(self, runs=None):
+        self._runs = []
+        self._starts = []
+        if runs:
+            for start, end, reference in runs:
+                self.add_run(start, end, reference)
+
+    @classmethod
+    def from_dict(cls, references_by_frame):
+        """Create object from dictionary with frame references."""
+        output = cls()
+        for frame_idx in sorted(references_by_frame):
+            reference = references_by_frame[frame_idx]
+            output.add_run(frame_idx, frame_idx, reference)
+        return output
+
+    @classmethod
+    def from_array(cls, references, range_start):
+        """Create object from array of frame references.
+
+        Frames with value 'MATRIX_NOT_COVERED' are skipped and frames
+        with value 'MATRIX_TRANSPARENT' reference 'None'.
+
+        Args:
+            references (np.ndarray): Reference frame for each frame of range.
+            range_start (int): Frame index of first item in array.
+        """
+        output = cls()
+        if not len(references):
+            return output
+        # Indexes where reference changes
+        change_indexes = np.flatnonzero(np.diff(references)) + 1
+        starts = np.concatenate(([0], change_indexes))
+        ends = np.concatenate((change_indexes, [len(references)])) - 1
+        values = references[starts].tolist()
+        # Runs are already merged and sorted so they can be set directly
+        output._runs = [
+            (
+                start + range_start,
+                end + range_start,
+                None if value == MATRIX_TRANSPARENT else value
+            )
+            for start, end, value in zip(
+                starts.tolist(), ends.tolist(), values
+            )
+            if value != MATRIX_NOT_COVERED
+        ]
+        output._starts = [run[0] for run in output._runs]
+        return output
+
+    def add_run(self, start, end, reference):
+        """Add run of frames referencing the same frame.
+
+        Runs must be added in ascending order. Run is merged with previous
+        run if they are continuous and have same reference.
+        """
+        if start > end:
+            return
+        if self._runs:
+            last_start, last_end, last_reference = self._runs[-1]
+            if start <= last_end:
+                raise ValueError(
+                    "Runs must be added in ascending order."
+                )
+            if last_end + 1 == start and last_reference == reference:
+                self._runs[-1] = (last_start, end, reference)
+                return
+        self._runs.append((start, end, reference))
+        self._starts.append(start)
+
+    def without_references(self, references):
+        """Copy of frame references where passed references are transparent.
+
+        Args:
+            references (Iterable[int]): Referenced frames that should be
+                replaced with transparent frame, e.g. empty exposures.
+
+        Returns:
+            FrameReferences: New frame references.
+        """
+        references = set(references)
+        output = self.__class__()
+        for start, end, reference in self._runs:
+            if reference in references:
+                reference = None
+            output.add_run(start, end, reference)
+        return output
+
+    def iter_runs(self):
+        """Iterate over runs.
+
+        Returns:
+            Iterator[tuple[int, int, Union[int, None]]]: Runs of frames.
+        """
+        return iter(self._runs)
+
+    def get_frames_to_render(self):
+        """Frames which are referenced and must be rendered.
+
+        Returns:
+            set[int]: Referenced frames without transparent frames.
+        """
+        return {
+            reference
+            for _, _, reference in self._runs
+            if reference is not None
+        }
 
-    first_exposure_frame = min(exposure_frames)
-    # Skip if last exposure frame is after range end
-    if first_exposure_frame < range_start:
-        return
+    def _find_run(self, frame_idx):
+        pos = bisect.bisect_right(self._starts, frame_idx) - 1
+        if pos < 0:
+            return None
+        run = self._runs[pos]
+        if frame_idx > run[1]:
+            return None
+        return run
 
-    # Calculate frame count of layer
-    frame_count = layer_frame_end - layer_frame_start + 1
+    def __getitem__(self, frame_idx):
+        run = self._find_run(frame_idx)
+        if run is None:
+            raise KeyError(frame_idx)
+        return run[2]
 
-    if pre_beh == "none":
-        # Just fill all frames from last exposure frame to range end with None
-        for frame_idx in range(range_start, layer_frame_start):
-            output_idx_by_frame_idx[frame_idx] = None
+    def __contains__(self, frame_idx):
+        return self._find_run(frame_idx) is not None
 
-    elif pre_beh == "hold":
-        # Keep first frame for whole time
-        for frame_idx in range(range_start, layer_frame_start):
-            output_idx_by_frame_idx[frame_idx] = first_exposure_frame
+    def __iter__(self):
+        for start, end, _ in self._runs:
+            yield from range(start, end + 1)
 
-    elif pre_beh == "repeat":
-        # Loop backwards from last frame of layer
-        for frame_idx in reversed(range(range_start, layer_frame_start)):
-            eq_frame_idx_offset = (
-                (layer_frame_end - frame_idx) % frame_count
-            )
-            eq_frame_idx = layer_frame_start + (
-                layer_frame_end - eq_frame_idx_offset
-            )
-            output_idx_by_frame_idx[frame_idx] = eq_frame_idx
+    def __len__(self):
+        return sum(end - start + 1 for start, end, _ in self._runs)
 
-    elif pre_beh == "pingpong":
-        half_seq_len = frame_count - 1
-        seq_len = half_seq_len * 2
-        for frame_idx in reversed(range(range_start, layer_frame_start)):
-            eq_frame_idx_offset = (layer_frame_start - frame_idx) % seq_len
-            if eq_frame_idx_offset > half_seq_len:
-                eq_frame_idx_offset = (seq_len - eq_frame_idx_offset)
-            eq_frame_idx = layer_frame_start + eq_frame_idx_offset
-            output_idx_by_frame_idx[frame_idx] = eq_frame_idx
+    def items(self):
+        for start, end, reference in self._runs:
+            for frame_idx in range(start, end + 1):
+                yield frame_idx, reference
 
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self._runs)
 
-def _calculate_post_behavior_copy(
-    range_end, exposure_frames, post_beh,
-    layer_frame_start, layer_frame_end,
-    output_idx_by_frame_idx
-):
-    """Calculate frames after last frame of layer based on post behavior.
 
-    Function may skip whole processing if last layer frame is after range_end.
-    In that case post behavior does not make sense.
+class FilenamesByFrame(Mapping):
+    """Filenames of frames in range generated from template on demand.
 
     Args:
-        range_end(int): Last frame of range which should be rendered.
-        exposure_frames(list): List of all exposure frames on layer.
-        post_beh(str): Post behavior of layer (enum of 4 strings).
-        layer_frame_start(int): First frame of layer.
-        layer_frame_end(int): Last frame of layer.
-        output_idx_by_frame_idx(dict): References to already prepared frames
-            and where result will be stored.
+        template (str): Filename template with '{frame}' key.
+        frame_start (int): First frame of range.
+        frame_end (int): Last frame of range.
+        frame_offset (int): Offset added to frame index in filename.
+        **template_data: Additional data used to fill the template.
     """
-    # Check if last layer frame is after range end
-    if layer_frame_end >= range_end:
-        return
+    def __init__(
+        self, template, frame_start, frame_end, frame_offset=0,
+        **template_data
+    ):
+        self._template = template
+        self._frame_start = frame_start
+        self._frame_end = frame_end
+        self._frame_offset = frame_offset
+        self._template_data = template_data
+
+    def __getitem__(self, frame_idx):
+        if not self._frame_start <= frame_idx <= self._frame_end:
+            raise KeyError(frame_idx)
+        return self._template.format(
+            frame=frame_idx + self._frame_offset, **self._template_data
+        )
 
-    last_exposure_frame = max(exposure_frames)
-    # Skip if last exposure frame is after range end
-    #   - this is probably irrelevant with layer frame end check?
-    if last_exposure_frame >= range_end:
-        return
+    def __contains__(self, frame_idx):
+        return self._frame_start <= frame_idx <= self._frame_end
 
-    # Calculate frame count of layer
-    frame_count = layer_frame_end - layer_frame_start + 1
+    def __iter__(self):
+        return iter(range(self._frame_start, self._frame_end + 1))
 
-    if post_beh == "none":
-        # Just fill all frames from last exposure frame to range end with None
-        for frame_idx in range(layer_frame_end + 1, range_end + 1):
-            output_idx_by_frame_idx[frame_idx] = None
+    def __len__(self):
+        return max(0, self._frame_end - self._frame_start + 1)
 
-    elif post_beh == "hold":
-        # Keep last exposure frame to the end
-        for frame_idx in range(layer_frame_end + 1, range_end + 1):
-            output_idx_by_frame_idx[frame_idx] = last_exposure_frame
 
-    elif post_beh == "repeat":
-        # Loop backwards from last frame of layer
-        for frame_idx in range(layer_frame_end + 1, range_end + 1):
-            eq_frame_idx = layer_frame_start + (frame_idx % frame_count)
-            output_idx_by_frame_idx[frame_idx] = eq_frame_idx
+class FilepathsByFrame(Mapping):
+    """Filepaths of layer frames based on frame references.
 
-    elif post_beh == "pingpong":
-        half_seq_len = frame_count - 1
-        seq_len = half_seq_len * 2
-        for frame_idx in range(layer_frame_end + 1, range_end + 1):
-            eq_frame_idx_offset = (frame_idx - layer_frame_end) % seq_len
-            if eq_frame_idx_offset > half_seq_len:
-                eq_frame_idx_offset = seq_len - eq_frame_idx_offset
-            eq_frame_idx = layer_frame_end - eq_frame_idx_offset
-            output_idx_by_frame_idx[frame_idx] = eq_frame_idx
+    Frames referencing transparent frame have 'None' as filepath and frames
+    without reference are not available.
 
+    Args:
+        frame_references (Mapping[int, Union[int, None]]): Frame references.
+        filenames_by_frame (Mapping[int, str]): Filenames by frame index.
+        dirpath (str): Directory where files are stored.
+    """
+    def __init__(self, frame_references, filenames_by_frame, dirpath):
+        self._frame_references = frame_references
+        self._filenames_by_frame = filenames_by_frame
+        self._dirpath = dirpath
 
-def _calculate_in_range_frames(
-    range_start, range_end,
-    exposure_frames, layer_frame_end,
-    output_idx_by_frame_idx
-):
-    """Calculate frame references in defined range.
+    @property
+    def frame_references(self):
+        return self._frame_references
+
+    def __getitem__(self, frame_idx):
+        if self._frame_references[frame_idx] is None:
+            return None
+        filename = self._filenames_by_frame[frame_idx]
+        return "/".join([self._dirpath, filename])
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self._frame_references
+
+    def __iter__(self):
+        return iter(self._frame_references)
 
-    Function may skip whole processing if last layer frame is after range_end.
-    In that case post behavior does not make sense.
+    def __len__(self):
+        return len(self._frame_references)
+
+
+def _find_exposure_frame(exposure_frames, frame_idx):
+    """Find exposure frame which is shown on passed frame of layer.
 
     Args:
-        range_start(int): First frame of range which should be rendered.
-        range_end(int): Last frame of range which should be rendered.
-        exposure_frames(list): List of all exposure frames on layer.
-        layer_frame_end(int): Last frame of layer.
-        output_idx_by_frame_idx(dict): References to already prepared frames
-            and where result will be stored.
-    """
-    # Calculate in range frames
-    in_range_frames = []
-    for frame_idx in exposure_frames:
-        if range_start <= frame_idx <= range_end:
-            output_idx_by_frame_idx[frame_idx] = frame_idx
-            in_range_frames.append(frame_idx)
-
-    if in_range_frames:
-        first_in_range_frame = min(in_range_frames)
-        # Calculate frames from first exposure frames to range end or last
-        #   frame of layer (post behavior should be calculated since that time)
-        previous_exposure = first_in_range_frame
-        for frame_idx in range(first_in_range_frame, range_end + 1):
-            if frame_idx > layer_frame_end:
-                break
+        exposure_frames(list[int]): Sorted exposure frames of layer.
+        frame_idx(int): Frame index of layer.
 
-            if frame_idx in exposure_frames:
-                previous_exposure = frame_idx
-            else:
-                output_idx_by_frame_idx[frame_idx] = previous_exposure
+    Returns:
+        Union[int, None]: Exposure frame or None if there is no exposure
+            frame before passed frame.
+    """
+    pos = bisect.bisect_right(exposure_frames, frame_idx) - 1
+    if pos < 0:
+        return None
+    return exposure_frames[pos]
 
-    # There can be frames before first exposure frame in range
-    # First check if we don't alreade have first range frame filled
-    if range_start in output_idx_by_frame_idx:
-        return
 
-    first_exposure_frame = max(exposure_frames)
-    last_exposure_frame = max(exposure_frames)
-    # Check if is first exposure frame smaller than defined range
-    #   if not then skip
-    if first_exposure_frame >= range_start:
-        return
+def _get_pre_behavior_frame(
+    frame_idx, pre_beh, exposure_frames, layer_frame_start, layer_frame_end
+):
+    """Calculate frame reference of frame before layer's first frame.
 
-    # Check is if last exposure frame is also before range start
-    #   in that case we can't use fill frames before out range
-    if last_exposure_frame < range_start:
-        return
+    Args:
+        frame_idx(int): Frame index before first frame of layer.
+        pre_beh(str): Pre behavior of layer (enum of 4 strings).
+        exposure_frames(list[int]): Sorted exposure frames of layer.
+        layer_frame_start(int): First frame of layer.
+        layer_frame_end(int): Last frame of layer.
 
-    closest_exposure_frame = first_exposure_frame
-    for frame_idx in exposure_frames:
-        if frame_idx >= range_start:
-            break
-        if frame_idx > closest_exposure_frame:
-            closest_exposure_frame = frame_idx
+    Returns:
+        Union[int, None]: Exposure frame or None for transparent frame.
+    """
+    if pre_beh == "hold":
+        # Keep first frame for whole time
+        return exposure_frames[0]
 
-    output_idx_by_frame_idx[closest_exposure_frame] = closest_exposure_frame
-    for frame_idx in range(range_start, range_end + 1):
-        if frame_idx in output_idx_by_frame_idx:
-            break
-        output_idx_by_frame_idx[frame_idx] = closest_exposure_frame
+    frame_count = layer_frame_end - layer_frame_start + 1
+    if pre_beh == "repeat":
+        # Loop backwards from last frame of layer
+        eq_frame_idx = layer_frame_end - (
+            (layer_frame_end - frame_idx) % frame_count
+        )
 
+    elif pre_beh == "pingpong":
+        half_seq_len = frame_count - 1
+        eq_frame_idx = layer_frame_start
+        if half_seq_len:
+            seq_len = half_seq_len * 2
+            eq_frame_idx_offset = (layer_frame_start - frame_idx) % seq_len
+            if eq_frame_idx_offset > half_seq_len:
+                eq_frame_idx_offset = seq_len - eq_frame_idx_offset
+            eq_frame_idx = layer_frame_start + eq_frame_idx_offset
 
-def _cleanup_frame_references(output_idx_by_frame_idx):
-    """Cleanup frame references to frame reference.
+    else:
+        return None
+    return _find_exposure_frame(exposure_frames, eq_frame_idx)
 
-    Cleanup not direct references to rendered frame.
-    ```
-    // Example input
-    {
-        1: 1,
-        2: 1,
-        3: 2
-    }
-    // Result
-    {
-        1: 1,
-        2: 1,
-        3: 1 // Changed reference to final rendered frame
-    }
-    ```
-    Result is dictionary where keys leads to frame that should be rendered.
+
+def _get_post_behavior_frame(
+    frame_idx, post_beh, exposure_frames, layer_frame_start, layer_frame_end
+):
+    """Calculate frame reference of frame after layer's last frame.
+
+    Args:
+        frame_idx(int): Frame index after last frame of layer.
+        post_beh(str): Post behavior of layer (enum of 4 strings).
+        exposure_frames(list[int]): Sorted exposure frames of layer.
+        layer_frame_start(int): First frame of layer.
+        layer_frame_end(int): Last frame of layer.
+
+    Returns:
+        Union[int, None]: Exposure frame or None for transparent frame.
     """
-    for frame_idx in tuple(output_idx_by_frame_idx.keys()):
-        reference_idx = output_idx_by_frame_idx[frame_idx]
-        # Skip transparent frames
-        if reference_idx is None or reference_idx == frame_idx:
-            continue
+    if post_beh == "hold":
+        # Keep last exposure frame to the end
+        return exposure_frames[-1]
 
-        real_reference_idx = reference_idx
-        _tmp_reference_idx = reference_idx
-        while True:
-            _temp = output_idx_by_frame_idx[_tmp_reference_idx]
-            if _temp == _tmp_reference_idx:
-                real_reference_idx = _tmp_reference_idx
-                break
-            _tmp_reference_idx = _temp
+    frame_count = layer_frame_end - layer_frame_start + 1
+    if post_beh == "repeat":
+        # Loop from first frame of layer
+        eq_frame_idx = layer_frame_start + (
+            (frame_idx - layer_frame_start) % frame_count
+        )
+
+    elif post_beh == "pingpong":
+        half_seq_len = frame_count - 1
+        eq_frame_idx = layer_frame_end
+        if half_seq_len:
+            seq_len = half_seq_len * 2
+            eq_frame_idx_offset = (frame_idx - layer_frame_end) % seq_len
+            if eq_frame_idx_offset > half_seq_len:
+                eq_frame_idx_offset = seq_len - eq_frame_idx_offset
+            eq_frame_idx = layer_frame_end - eq_frame_idx_offset
 
-        if real_reference_idx != reference_idx:
-            output_idx_by_frame_idx[frame_idx] = real_reference_idx
+    else:
+        return None
+    return _find_exposure_frame(exposure_frames, eq_frame_idx)
 
 
-def _cleanup_out_range_frames(output_idx_by_frame_idx, range_start, range_end):
-    """Cleanup frame references to frames out of passed range.
+def _redirect_out_range_references(runs, range_start, range_end):
+    """Redirect frame references to frames out of passed range.
 
-    First available frame in range is used
+    First frame in range referencing the out of range frame is used.
     ```
     // Example input. Range 2-3
     {
-        1: 1,
         2: 1,
         3: 1
     }
@@ -284,36 +429,33 @@ def _cleanup_out_range_frames(output_idx_by_frame_idx, range_start, range_end):
         3: 2 // Redirect to first redirected frame
     }
     ```
-    Result is dictionary where keys leads to frame that should be rendered.
-    """
-    in_range_frames_by_out_frames = collections.defaultdict(set)
-    out_range_frames = set()
-    for frame_idx in tuple(output_idx_by_frame_idx.keys()):
-        # Skip frames that are already out of range
-        if frame_idx < range_start or frame_idx > range_end:
-            out_range_frames.add(frame_idx)
-            continue
-
-        reference_idx = output_idx_by_frame_idx[frame_idx]
-        # Skip transparent frames
-        if reference_idx is None:
-            continue
 
-        # Skip references in range
-        if reference_idx < range_start or reference_idx > range_end:
-            in_range_frames_by_out_frames[reference_idx].add(frame_idx)
+    Args:
+        runs (list[tuple[int, int, Union[int, None]]]): Runs of frames
+            sorted by start frame.
+        range_start (int): First frame of range.
+        range_end (int): Last frame of range.
 
-    for reference_idx in tuple(in_range_frames_by_out_frames.keys()):
-        frame_indexes = in_range_frames_by_out_frames.pop(reference_idx)
-        new_reference = None
-        for frame_idx in frame_indexes:
-            if new_reference is None:
-                new_reference = frame_idx
-            output_idx_by_frame_idx[frame_idx] = new_reference
+    Returns:
+        FrameReferences: Frame references without out of range references.
+    """
+    output = FrameReferences()
+    new_reference_by_reference = {}
+    for start, end, reference in runs:
+        # Keep transparent frames and references in range
+        if reference is None or range_start <= reference <= range_end:
+            output.add_run(start, end, reference)
+            continue
 
-    # Finally remove out of range frames
-    for frame_idx in out_range_frames:
-        output_idx_by_frame_idx.pop(frame_idx)
+        new_reference = new_reference_by_reference.get(reference)
+        if new_reference is None:
+            # First frame referencing out of range frame is rendered
+            new_reference = start
+            new_reference_by_reference[reference] = new_reference
+            output.add_run(start, start, new_reference)
+            start += 1
+        output.add_run(start, end, new_reference)
+    return output
 
 
 def calculate_layer_frame_references(
@@ -325,8 +467,10 @@ def calculate_layer_frame_references(
 ):
     """Calculate frame references for one layer based on it's data.
 
-    Output is dictionary where key is frame index referencing to rendered frame
+    Output is mapping where key is frame index referencing to rendered frame
     index. If frame index should be rendered then is referencing to self.
+    Frames are stored as runs of frames with same reference (see
+    'FrameReferences').
 
     ```
     // Example output
@@ -341,6 +485,11 @@ def calculate_layer_frame_references(
     }
     ```
 
+    Frames of layer reference the last exposure frame before them. Frames
+    before and after layer are calculated by pre and post behavior of
+    the layer. Exposure frames are looked up with bisect so the calculation
+    is linear to the range length.
+
     Args:
         range_start(int): First frame of range which should be rendered.
         range_end(int): Last frame of range which should be rendered.
@@ -349,38 +498,280 @@ def calculate_layer_frame_references(
         exposure_frames(list): List of all exposure frames on layer.
         pre_beh(str): Pre behavior of layer (enum of 4 strings).
         post_beh(str): Post behavior of layer (enum of 4 strings).
+
+    Returns:
+        FrameReferences: Frame references of layer.
     """
-    # Output variable
-    output_idx_by_frame_idx = {}
     # Skip if layer does not have any exposure frames
     if not exposure_frames:
-        return output_idx_by_frame_idx
+        return FrameReferences()
+
+    exposure_frames = sorted(set(exposure_frames))
+    first_exposure_frame = exposure_frames[0]
+    last_exposure_frame = exposure_frames[-1]
+
+    references = FrameReferences()
 
-    # First calculate in range frames
-    _calculate_in_range_frames(
-        range_start, range_end,
-        exposure_frames, layer_frame_end,
-        output_idx_by_frame_idx
-    )
     # Calculate frames by pre behavior of layer
-    _calculate_pre_behavior_copy(
-        range_start, exposure_frames, pre_beh,
-        layer_frame_start, layer_frame_end,
-        output_idx_by_frame_idx
-    )
+    # - pre behavior does not make sense if layer starts before range
+    if (
+        pre_beh in LAYER_BEHAVIORS
+        and layer_frame_start >= range_start
+        and first_exposure_frame >= range_start
+    ):
+        for frame_idx in range(
+            range_start, min(layer_frame_start, range_end + 1)
+        ):
+            reference = _get_pre_behavior_frame(
+                frame_idx,
+                pre_beh,
+                exposure_frames,
+                layer_frame_start,
+                layer_frame_end,
+            )
+            references.add_run(frame_idx, frame_idx, reference)
+
+    # Calculate frames of layer in range
+    # - each frame is referencing last exposure frame before it
+    in_range_start = max(range_start, layer_frame_start)
+    in_range_end = min(range_end, layer_frame_end)
+    if in_range_start <= in_range_end:
+        exposure_pos = max(
+            0, bisect.bisect_right(exposure_frames, in_range_start) - 1
+        )
+        exposures_len = len(exposure_frames)
+        while exposure_pos < exposures_len:
+            exposure_frame = exposure_frames[exposure_pos]
+            if exposure_frame > in_range_end:
+                break
+            exposure_pos += 1
+            next_exposure_frame = in_range_end + 1
+            if exposure_pos < exposures_len:
+                next_exposure_frame = min(
+                    next_exposure_frame, exposure_frames[exposure_pos]
+                )
+            references.add_run(
+                max(exposure_frame, in_range_start),
+                next_exposure_frame - 1,
+                exposure_frame
+            )
+
     # Calculate frames by post behavior of layer
-    _calculate_post_behavior_copy(
-        range_end, exposure_frames, post_beh,
-        layer_frame_start, layer_frame_end,
-        output_idx_by_frame_idx
+    # - post behavior does not make sense if layer ends after range
+    if (
+        post_beh in LAYER_BEHAVIORS
+        and layer_frame_end < range_end
+        and last_exposure_frame < range_end
+    ):
+        for frame_idx in range(
+            max(layer_frame_end + 1, range_start), range_end + 1
+        ):
+            reference = _get_post_behavior_frame(
+                frame_idx,
+                post_beh,
+                exposure_frames,
+                layer_frame_start,
+                layer_frame_end,
+            )
+            references.add_run(frame_idx, frame_idx, reference)
+
+    # Redirect references to frames out of range
+    return _redirect_out_range_references(
+        references.iter_runs(), range_start, range_end
+    )
+
+
+def _get_behavior_frames_array(
+    frames,
+    behavior,
+    exposure_frames,
+    layer_frame_start,
+    layer_frame_end,
+    is_pre,
+):
+    """Vectorized version of '_get_pre_behavior_frame' and post variant.
+
+    Returns:
+        np.ndarray: Exposure frames or 'MATRIX_TRANSPARENT' for transparent
+            frames.
+    """
+    if behavior == "hold":
+        exposure_frame = exposure_frames[0] if is_pre else exposure_frames[-1]
+        return np.full(frames.shape, exposure_frame, dtype=np.int64)
+
+    if behavior not in ("repeat", "pingpong"):
+        return np.full(frames.shape, MATRIX_TRANSPARENT, dtype=np.int64)
+
+    frame_count = layer_frame_end - layer_frame_start + 1
+    if behavior == "repeat":
+        if is_pre:
+            eq_frames = layer_frame_end - (
+                (layer_frame_end - frames) % frame_count
+            )
+        else:
+            eq_frames = layer_frame_start + (
+                (frames - layer_frame_start) % frame_count
+            )
+
+    else:
+        half_seq_len = frame_count - 1
+        if not half_seq_len:
+            eq_frames = np.full(frames.shape, layer_frame_start)
+        else:
+            seq_len = half_seq_len * 2
+            if is_pre:
+                offsets = (layer_frame_start - frames) % seq_len
+            else:
+                offsets = (frames - layer_frame_end) % seq_len
+            offsets = np.where(
+                offsets > half_seq_len, seq_len - offsets, offsets
+            )
+            if is_pre:
+                eq_frames = layer_frame_start + offsets
+            else:
+                eq_frames = layer_frame_end - offsets
+
+    return _find_exposure_frames_array(
+        exposure_frames, eq_frames, MATRIX_TRANSPARENT
     )
-    # Cleanup of referenced frames
-    _cleanup_frame_references(output_idx_by_frame_idx)
 
-    # Remove frames out of range
-    _cleanup_out_range_frames(output_idx_by_frame_idx, range_start, range_end)
 
-    return output_idx_by_frame_idx
+def _find_exposure_frames_array(exposure_frames, frames, missing_value):
+    """Vectorized version of '_find_exposure_frame'.
+
+    Args:
+        exposure_frames (np.ndarray): Sorted exposure frames of layer.
+        frames (np.ndarray): Frames to find exposure frames for.
+        missing_value (int): Value used where there is no exposure frame.
+
+    Returns:
+        np.ndarray: Exposure frames or missing value where there is no
+            exposure frame.
+    """
+    positions = np.searchsorted(exposure_frames, frames, side="right") - 1
+    return np.where(
+        positions >= 0,
+        exposure_frames[np.clip(positions, 0, None)],
+        missing_value
+    ).astype(np.int64)
+
+
+def calculate_layers_frame_references_matrix(
+    layers_data,
+    exposure_frames_by_layer_id,
+    behavior_by_layer_id,
+    range_start,
+    range_end,
+    skip_not_visible=True,
+):
+    """Calculate frame references of multiple layers at once.
+
+    Vectorized equivalent of 'calculate_layer_frame_references' for all
+    passed layers. Result is matrix with row per layer and column per frame
+    in range. Values are referenced frames, 'MATRIX_TRANSPARENT' is used for
+    transparent frames and 'MATRIX_NOT_COVERED' for frames which are not
+    covered by layer. Both values are out of range of possible frames so
+    negative frames can be referenced.
+
+    Args:
+        layers_data(list): Layers data loaded from TVPaint.
+        exposure_frames_by_layer_id(dict): Exposure frames of layers stored by
+            layer id.
+        behavior_by_layer_id(dict): Pre and Post behavior of layers stored by
+            layer id.
+        range_start(int): First frame of rendered range.
+        range_end(int): Last frame of rendered range.
+        skip_not_visible(bool): Skip calculations for hidden layers (Skipped
+            by default).
+
+    Returns:
+        tuple[list, np.ndarray]: Layer ids matching rows of matrix and
+            '(layers x frames)' int64 matrix of references.
+    """
+    backwards_id_conversion(exposure_frames_by_layer_id)
+    backwards_id_conversion(behavior_by_layer_id)
+
+    frames = np.arange(range_start, range_end + 1, dtype=np.int64)
+    layer_ids = []
+    rows = []
+    for layer_data in layers_data:
+        if skip_not_visible and not layer_data["visible"]:
+            continue
+
+        layer_id = layer_data["layer_id"]
+        exposure_frames = exposure_frames_by_layer_id[str(layer_id)]
+        layer_ids.append(layer_id)
+        row = np.full(frames.shape, MATRIX_NOT_COVERED, dtype=np.int64)
+        rows.append(row)
+        if not exposure_frames:
+            continue
+
+        exposure_frames = np.unique(
+            np.asarray(exposure_frames, dtype=np.int64)
+        )
+        layer_frame_start = layer_data["frame_start"]
+        layer_frame_end = layer_data["frame_end"]
+        layer_behavior = behavior_by_layer_id[str(layer_id)]
+        pre_beh = layer_behavior["pre"]
+        post_beh = layer_behavior["post"]
+
+        # Frames of layer reference last exposure frame before them
+        in_layer_mask = (
+            (frames >= layer_frame_start) & (frames <= layer_frame_end)
+        )
+        # - frames before first exposure frame are not covered
+        row[in_layer_mask] = _find_exposure_frames_array(
+            exposure_frames, frames[in_layer_mask], MATRIX_NOT_COVERED
+        )
+
+        if (
+            pre_beh in LAYER_BEHAVIORS
+            and layer_frame_start >= range_start
+            and exposure_frames[0] >= range_start
+        ):
+            pre_mask = frames < layer_frame_start
+            row[pre_mask] = _get_behavior_frames_array(
+                frames[pre_mask],
+                pre_beh,
+                exposure_frames,
+                layer_frame_start,
+                layer_frame_end,
+                True,
+            )
+
+        if (
+            post_beh in LAYER_BEHAVIORS
+            and layer_frame_end < range_end
+            and exposure_frames[-1] < range_end
+        ):
+            post_mask = frames > layer_frame_end
+            row[post_mask] = _get_behavior_frames_array(
+                frames[post_mask],
+                post_beh,
+                exposure_frames,
+                layer_frame_start,
+                layer_frame_end,
+                False,
+            )
+
+        # Redirect references out of range to first frame referencing them
+        out_range_mask = (row > MATRIX_TRANSPARENT) & (
+            (row < range_start) | (row > range_end)
+        )
+        if out_range_mask.any():
+            out_indexes = np.flatnonzero(out_range_mask)
+            out_references = row[out_indexes]
+            _, first_positions, inverse = np.unique(
+                out_references, return_index=True, return_inverse=True
+            )
+            new_references = frames[out_indexes[first_positions]]
+            row[out_indexes] = new_references[inverse]
+
+    if rows:
+        matrix = np.stack(rows)
+    else:
+        matrix = np.empty((0, len(frames)), dtype=np.int64)
+    return layer_ids, matrix
 
 
 def calculate_layers_extraction_data(
@@ -391,15 +782,16 @@ def calculate_layers_extraction_data(
     range_end,
     skip_not_visible=True,
     filename_prefix=None,
-    ext=None
+    ext=None,
+    frame_offset=0,
 ):
     """Calculate extraction data for passed layers data.
 
     ```
     {
         <layer_id>: {
-            "frame_references": {...},
-            "filenames_by_frame_index": {...}
+            "frame_references": FrameReferences(...),
+            "filenames_by_frame_index": FilenamesByFrame(...)
         },
         ...
     }
@@ -409,7 +801,9 @@ def calculate_layers_extraction_data(
 
     Filename by frame index represents filename under which should be frame
     stored. Directory is not handled here because each usage may need different
-    approach.
+    approach. Filenames are generated from template on demand. Frame
+    in filenames is shifted by frame offset, so files can be named by output
+    frames while data are stored by frame index in scene.
 
     Args:
         layers_data(list): Layers data loaded from TVPaint.
@@ -423,6 +817,7 @@ def calculate_layers_extraction_data(
             by default).
         filename_prefix(str): Prefix before filename.
         ext(str): Extension which filenames will have ('.png' is default).
+        frame_offset(int): Offset added to frame index in filenames.
 
     Returns:
         dict: Prepared data for rendering by layer position.
@@ -433,8 +828,25 @@ def calculate_layers_extraction_data(
     backwards_id_conversion(behavior_by_layer_id)
 
     layer_template = get_layer_pos_filename_template(
-        range_end, filename_prefix, ext
+        max(range_end, range_end + frame_offset), filename_prefix, ext
     )
+    # Use vectorized calculation for large scenes
+    references_by_layer_id = {}
+    frames_count = range_end - range_start + 1
+    if len(layers_data) * frames_count >= MATRIX_CALCULATION_THRESHOLD:
+        layer_ids, matrix = calculate_layers_frame_references_matrix(
+            layers_data,
+            exposure_frames_by_layer_id,
+            behavior_by_layer_id,
+            range_start,
+            range_end,
+            skip_not_visible,
+        )
+        for layer_id, row in zip(layer_ids, matrix):
+            references_by_layer_id[layer_id] = FrameReferences.from_array(
+                row, range_start
+            )
+
     output = {}
     for layer_data in layers_data:
         if skip_not_visible and not layer_data["visible"]:
@@ -457,35 +869,28 @@ def calculate_layers_extraction_data(
         pre_behavior = layer_behavior["pre"]
         post_behavior = layer_behavior["post"]
 
-        frame_references = calculate_layer_frame_references(
-            range_start, range_end,
-            layer_frame_start,
-            layer_frame_end,
-            exposure_frames,
-            pre_behavior, post_behavior
-        )
-        # All values in 'frame_references' reference to a frame that must be
-        #   rendered out
-        frames_to_render = set(frame_references.values())
-        # Remove 'None' reference (transparent image)
-        if None in frames_to_render:
-            frames_to_render.remove(None)
-
+        frame_references = references_by_layer_id.get(orig_layer_id)
+        if frame_references is None:
+            frame_references = calculate_layer_frame_references(
+                range_start, range_end,
+                layer_frame_start,
+                layer_frame_end,
+                exposure_frames,
+                pre_behavior, post_behavior
+            )
         # Skip layer if has nothing to render
-        if not frames_to_render:
+        if not frame_references.get_frames_to_render():
             continue
 
         # All filenames that should be as output (not final output)
-        filename_frames = (
-            set(range(range_start, range_end + 1))
-            | frames_to_render
+        # - referenced frames are always in range
+        filenames_by_frame_index = FilenamesByFrame(
+            layer_template,
+            range_start,
+            range_end,
+            frame_offset=frame_offset,
+            pos=layer_position,
         )
-        filenames_by_frame_index = {}
-        for frame_idx in filename_frames:
-            filenames_by_frame_index[frame_idx] = layer_template.format(
-                pos=layer_position,
-                frame=frame_idx
-            )
 
         # Store objects under the layer id
         output[orig_layer_id] = {
@@ -514,6 +919,9 @@ def fill_reference_frames(frame_references, filepaths_by_frame):
         # Get destination filepath
         src_filepath = filepaths_by_frame[ref_idx]
         dst_filepath = filepaths_by_frame[frame_idx]
+        # File may be left from previous extraction to the same directory
+        if os.path.lexists(dst_filepath):
+            os.remove(dst_filepath)
 
         # This is to avoid errors on Windows when too many hardlinks are
         # created with longer sequences (more than 1024). We fall back to
@@ -534,11 +942,1432 @@ def fill_reference_frames(frame_references, filepaths_by_frame):
 
 
 def copy_render_file(src_path, dst_path):
-    """Create copy file of an image."""
+    """Create copy file of an image.
+
+    Hardlink is used when possible, copy is used as fallback e.g. when
+    files are on different devices.
+    """
     if hasattr(os, "link"):
-        os.link(src_path, dst_path)
+        try:
+            os.link(src_path, dst_path)
+            return
+        except OSError:
+            pass
+    shutil.copy(src_path, dst_path)
+
+
+class LayerRenderCache:
+    """Layer frames exported from TVPaint during one publishing.
+
+    The same layers are often part of multiple instances (e.g. render layer
+    and its render passes). Frames are exported to cache directory only once
+    and each instance creates a hardlink to the cached file.
+
+    Cached files must not be modified, only removed when publishing ends.
+
+    Args:
+        root_dir (str): Directory where exported frames are stored.
+    """
+    def __init__(self, root_dir):
+        self._root_dir = root_dir.replace("\\", "/")
+        self._filepaths = {}
+        self._alpha_bboxes = {}
+        self._content_hashes = {}
+        self._new_filepaths = []
+
+    @property
+    def root_dir(self):
+        return self._root_dir
+
+    def get_filepath(self, layer_id, frame_idx):
+        """Filepath of already exported layer frame.
+
+        Returns:
+            Union[str, None]: Path to exported frame or 'None' if frame was
+                not exported yet.
+        """
+        filepath = self._filepaths.get((layer_id, frame_idx))
+        if filepath and os.path.exists(filepath):
+            return filepath
+        return None
+
+    def get_export_filepath(self, layer_id, frame_idx, ext=None):
+        """Filepath where layer frame should be exported to be cached."""
+        ext = ext or ".png"
+        return "/".join([
+            self._root_dir,
+            "layer_{}.{}{}".format(layer_id, frame_idx, ext)
+        ])
+
+    def add(self, layer_id, frame_idx, filepath):
+        """Mark layer frame as exported to the filepath."""
+        self._filepaths[(layer_id, frame_idx)] = filepath
+        self._new_filepaths.append(filepath)
+
+    def get_alpha_bbox(
+        self, layer_id, frame_idx, filepath, image_cache=None
+    ):
+        """Bounding box of visible pixels of layer frame.
+
+        Bounding box is calculated only once per layer frame.
+
+        Args:
+            layer_id (int): Layer id.
+            frame_idx (int): Exposure frame index.
+            filepath (str): Path to exported frame.
+            image_cache (Optional[DecodedImageCache]): Cache where decoded
+                pixels are kept for compositing. Pixels are stored under
+                '(layer_id, frame_idx)' key.
+
+        Returns:
+            Union[tuple[int, int, int, int], None]: Bounding box or 'None'
+                if frame is fully transparent.
+        """
+        key = (layer_id, frame_idx)
+        if key not in self._alpha_bboxes:
+            if image_cache is None:
+                alpha_bbox = get_image_alpha_bbox(filepath)
+            else:
+                alpha_bbox = get_pixels_alpha_bbox(
+                    image_cache.get_pixels(key, filepath)
+                )
+            self._alpha_bboxes[key] = alpha_bbox
+        return self._alpha_bboxes[key]
+
+    def get_content_hash(self, layer_id, frame_idx, filepath):
+        """Hash of content of layer frame file.
+
+        Hash is calculated only once per layer frame.
+
+        Returns:
+            str: Hex digest of file content.
+        """
+        key = (layer_id, frame_idx)
+        if key not in self._content_hashes:
+            self._content_hashes[key] = get_file_hash(filepath)
+        return self._content_hashes[key]
+
+    def pop_new_filepaths(self):
+        """Filepaths added to cache since last call of this method.
+
+        Returns:
+            list[str]: Filepaths of exported frames.
+        """
+        filepaths, self._new_filepaths = self._new_filepaths, []
+        return filepaths
+
+
+def get_image_alpha_bbox(filepath):
+    """Bounding box of pixels with alpha of an image.
+
+    Args:
+        filepath (str): Path to image.
+
+    Returns:
+        Union[tuple[int, int, int, int], None]: Bounding box as
+            '(left, top, right, bottom)' or 'None' if image is fully
+            transparent.
+    """
+    with Image.open(filepath) as img_obj:
+        if "A" not in img_obj.getbands():
+            return (0, 0, img_obj.width, img_obj.height)
+        return img_obj.getchannel("A").getbbox()
+
+
+def get_pixels_alpha_bbox(pixels):
+    """Bounding box of pixels with alpha of already decoded image.
+
+    Args:
+        pixels (np.ndarray): RGBA pixels with shape (height, width, 4).
+
+    Returns:
+        Union[tuple[int, int, int, int], None]: Bounding box as
+            '(left, top, right, bottom)' or 'None' if image is fully
+            transparent.
+    """
+    alpha = pixels[..., 3]
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return (
+        int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+    )
+
+
+def get_file_hash(filepath, chunk_size=1024 * 1024):
+    """Hash of file content.
+
+    Args:
+        filepath (str): Path to file.
+        chunk_size (int): Size of chunks read from file.
+
+    Returns:
+        str: Hex digest of file content.
+    """
+    hasher = hashlib.sha1()
+    with open(filepath, "rb") as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def create_transparent_image(width, height, dst_filepath):
+    """Create fully transparent RGBA image."""
+    Image.new("RGBA", (width, height), (255, 255, 255, 0)).save(
+        dst_filepath
+    )
+
+
+def load_image_pixels(filepath):
+    """Load image as RGBA pixels.
+
+    Args:
+        filepath (str): Path to image.
+
+    Returns:
+        np.ndarray: Read-only RGBA pixels with shape (height, width, 4).
+    """
+    with Image.open(filepath) as img_obj:
+        if img_obj.mode != "RGBA":
+            img_obj = img_obj.convert("RGBA")
+        pixels = np.asarray(img_obj)
+    pixels.flags.writeable = False
+    return pixels
+
+
+def _blend_source(state, pixels, opacity, bbox=None):
+    """Blend source over premultiplied accumulator.
+
+    Args:
+        state (Union[list, None]): Accumulator '[rgb, alpha, union bbox]'
+            or 'None' for the first source.
+        pixels (np.ndarray): RGBA uint8 pixels of source.
+        opacity (float): Opacity of source in range 0.0-1.0.
+        bbox (Optional[tuple[int, int, int, int]]): Bounding box of visible
+            pixels of source.
+
+    Returns:
+        list: Accumulator with blended source.
+    """
+    height, width = pixels.shape[:2]
+    if bbox is None:
+        bbox = (0, 0, width, height)
+    left, top, right, bottom = bbox
+    if state is None:
+        state = [
+            np.zeros((height, width, 3), dtype=np.float32),
+            np.zeros((height, width, 1), dtype=np.float32),
+            bbox,
+        ]
     else:
-        shutil.copy(src_path, dst_path)
+        union_bbox = state[2]
+        state[2] = (
+            min(union_bbox[0], left),
+            min(union_bbox[1], top),
+            max(union_bbox[2], right),
+            max(union_bbox[3], bottom),
+        )
+
+    region = pixels[top:bottom, left:right]
+    alpha = region[..., 3:4].astype(np.float32)
+    alpha *= opacity / 255.0
+    rgb = region[..., :3].astype(np.float32)
+    rgb *= alpha
+
+    out_rgb_region = state[0][top:bottom, left:right]
+    out_alpha_region = state[1][top:bottom, left:right]
+    inv_alpha = 1.0 - alpha
+    out_rgb_region *= inv_alpha
+    out_rgb_region += rgb
+    out_alpha_region *= inv_alpha
+    out_alpha_region += alpha
+    return state
+
+
+def _finish_composite(state):
+    """Convert premultiplied accumulator to straight alpha RGBA pixels."""
+    out_rgb, out_alpha, union_bbox = state
+    # Pixels outside of blended regions stay fully transparent
+    output = np.zeros(out_rgb.shape[:2] + (4, ), dtype=np.uint8)
+    left, top, right, bottom = union_bbox
+    out_rgb = out_rgb[top:bottom, left:right]
+    out_alpha = out_alpha[top:bottom, left:right]
+    np.divide(out_rgb, out_alpha, out=out_rgb, where=out_alpha > 0.0)
+    out_rgb[np.broadcast_to(out_alpha <= 0.0, out_rgb.shape)] = 0.0
+    out_alpha *= 255.0
+    output_region = output[top:bottom, left:right]
+    output_region[..., :3] = np.clip(out_rgb + 0.5, 0.0, 255.0)
+    output_region[..., 3:] = np.clip(out_alpha + 0.5, 0.0, 255.0)
+    return output
+
+
+def composite_pixels(sources):
+    """Composite RGBA pixels with "over" operation.
+
+    Sources are premultiplied by their alpha multiplied by opacity and
+    accumulated into single buffer. Result is converted back to straight
+    alpha.
+
+    Only region of source bounding box is blended if bounding box is
+    passed. Pixels outside of the bounding box must be fully transparent.
+
+    Args:
+        sources (Iterable[tuple]): RGBA uint8 pixels with opacity of the
+            source in range 0.0-1.0 and optionally bounding box of visible
+            pixels '(left, top, right, bottom)'. Ordered from bottom to top.
+
+    Raises:
+        ValueError: When sources are empty.
+
+    Returns:
+        np.ndarray: Composited RGBA uint8 pixels.
+    """
+    state = None
+    for source in sources:
+        state = _blend_source(state, *source)
+
+    if state is None:
+        raise ValueError("Nothing to composite.")
+    return _finish_composite(state)
+
+
+class StreamingPNGWriter:
+    """Write RGBA PNG image by rows without holding whole image in memory.
+
+    Rows are filtered with PNG "Up" filter and compressed into IDAT chunks
+    as they are written.
+
+    Args:
+        filepath (str): Output filepath.
+        width (int): Image width.
+        height (int): Image height.
+        compress_level (int): Zlib compression level.
+    """
+    _signature = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, filepath, width, height, compress_level=6):
+        self._stream = open(filepath, "wb")
+        self._compressor = zlib.compressobj(compress_level)
+        self._previous_row = np.zeros((1, width * 4), dtype=np.uint8)
+        self._stream.write(self._signature)
+        self._write_chunk(
+            b"IHDR",
+            # 8 bits per channel, RGBA color type, no interlace
+            struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._stream.close()
+
+    def _write_chunk(self, chunk_type, data):
+        crc = zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff
+        self._stream.write(struct.pack(">I", len(data)))
+        self._stream.write(chunk_type)
+        self._stream.write(data)
+        self._stream.write(struct.pack(">I", crc))
+
+    def write_rows(self, pixels):
+        """Write next rows of image.
+
+        Args:
+            pixels (np.ndarray): RGBA uint8 pixels with shape
+                (rows, width, 4).
+        """
+        rows = np.ascontiguousarray(pixels).reshape(len(pixels), -1)
+        if not len(rows):
+            return
+        previous_rows = np.concatenate((self._previous_row, rows[:-1]))
+        self._previous_row = rows[-1:].copy()
+
+        data = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        # Filter type "Up"
+        data[:, 0] = 2
+        np.subtract(rows, previous_rows, out=data[:, 1:])
+        compressed = self._compressor.compress(data.tobytes())
+        if compressed:
+            self._write_chunk(b"IDAT", compressed)
+
+    def close(self):
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._stream.close()
+
+
+def _composite_frame_in_stripes(
+    dst_filepath, sources, image_cache, stripe_height
+):
+    """Composite frame by horizontal stripes and stream it to PNG.
+
+    Only rows of one stripe are blended at a time so memory usage does not
+    depend on number of sources. Sources must be frames of layer frame
+    store so each stripe is read from memory-mapped file.
+
+    Args:
+        dst_filepath (str): Output filepath.
+        sources (list[tuple]): Sources with key, 'StoreFrame', opacity and
+            bounding box of visible pixels from bottom to top.
+        image_cache (DecodedImageCache): Cache used to access store files.
+        stripe_height (int): Number of rows in stripe.
+    """
+    views = [
+        (image_cache.get_pixels(src_key, src_frame), opacity, bbox)
+        for src_key, src_frame, opacity, bbox in sources
+    ]
+    height, width = views[0][0].shape[:2]
+    is_single_opaque = len(views) == 1 and views[0][1] == 1.0
+    with StreamingPNGWriter(dst_filepath, width, height) as writer:
+        for stripe_start in range(0, height, stripe_height):
+            stripe_end = min(height, stripe_start + stripe_height)
+            if is_single_opaque:
+                writer.write_rows(views[0][0][stripe_start:stripe_end])
+                continue
+
+            state = None
+            for pixels, opacity, bbox in views:
+                if bbox is None:
+                    bbox = (0, 0, width, height)
+                left, top, right, bottom = bbox
+                top = max(top, stripe_start)
+                bottom = min(bottom, stripe_end)
+                if top >= bottom:
+                    continue
+                state = _blend_source(
+                    state,
+                    pixels[stripe_start:stripe_end],
+                    opacity,
+                    (left, top - stripe_start, right, bottom - stripe_start)
+                )
+
+            if state is None:
+                stripe = np.zeros(
+                    (stripe_end - stripe_start, width, 4), dtype=np.uint8
+                )
+            else:
+                stripe = _finish_composite(state)
+            writer.write_rows(stripe)
+
+
+class PrefixCompositeCache:
+    """Least recently used cache of partially composited frames.
+
+    Partial composite of bottom layers is stored under keys of its sources.
+    Frame which has the same bottom sources can continue compositing from
+    the cached state and blend only the layers above.
+
+    Args:
+        max_size_mb (int): Maximum size of cached composites in megabytes.
+    """
+    def __init__(self, max_size_mb=DEFAULT_PREFIX_CACHE_SIZE_MB):
+        self._max_size = max(0, int(max_size_mb)) * 1024 * 1024
+        self._size = 0
+        self._states = OrderedDict()
+        # Number of cached prefixes by their length
+        self._depth_counts = {}
+
+    def get_deepest(self, keys):
+        """Find the longest cached prefix of passed source keys.
+
+        Args:
+            keys (tuple[Hashable, ...]): Keys of sources from bottom to top.
+
+        Returns:
+            tuple[int, Union[list, None]]: Number of sources in prefix with
+                copy of its accumulator, or '0' and 'None' if no prefix
+                is cached.
+        """
+        for depth in sorted(self._depth_counts, reverse=True):
+            if depth >= len(keys):
+                continue
+            prefix = keys[:depth]
+            state = self._states.get(prefix)
+            if state is None:
+                continue
+            self._states.move_to_end(prefix)
+            out_rgb, out_alpha, union_bbox = state
+            return depth, [out_rgb.copy(), out_alpha.copy(), union_bbox]
+        return 0, None
+
+    def add(self, prefix, state):
+        """Store copy of accumulator of sources with passed keys."""
+        if prefix in self._states:
+            return
+        out_rgb, out_alpha, union_bbox = state
+        size = out_rgb.nbytes + out_alpha.nbytes
+        if size > self._max_size:
+            return
+        self._states[prefix] = (out_rgb.copy(), out_alpha.copy(), union_bbox)
+        self._size += size
+        depth = len(prefix)
+        self._depth_counts[depth] = self._depth_counts.get(depth, 0) + 1
+        while self._size > self._max_size:
+            removed_prefix, removed = self._states.popitem(last=False)
+            self._size -= removed[0].nbytes + removed[1].nbytes
+            removed_depth = len(removed_prefix)
+            self._depth_counts[removed_depth] -= 1
+            if not self._depth_counts[removed_depth]:
+                self._depth_counts.pop(removed_depth)
+
+    def clear(self):
+        self._states.clear()
+        self._depth_counts.clear()
+        self._size = 0
+
+
+# Location of exposure pixels in layer frame store file
+StoreFrame = namedtuple("StoreFrame", ("filepath", "offset", "shape"))
+
+
+class LayerFrameStore(Mapping):
+    """Exposure frames of a layer stored in single memory-mapped file.
+
+    Exposures are stored as raw RGBA pixels one after another. Frames
+    referencing an exposure point to the same part of the file, so held
+    frames don't need any files. Store is used as source of
+    'composite_rendered_layers' in place of filepaths by frame.
+
+    Existing file is truncated when first exposure is added.
+
+    Args:
+        filepath (str): Path to store file.
+        frame_references (Mapping[int, Union[int, None]]): Frame references.
+    """
+    def __init__(self, filepath, frame_references):
+        self._filepath = filepath
+        self._frame_references = frame_references
+        self._offset_by_frame = {}
+        self._shape = None
+        self._size = 0
+
+    @property
+    def filepath(self):
+        return self._filepath
+
+    @property
+    def frame_references(self):
+        return self._frame_references
+
+    def add_exposure(self, frame_idx, src_filepath):
+        """Store pixels of exposure frame loaded from image file.
+
+        Fully transparent exposures are not stored, frames referencing them
+        should be removed with 'remove_references'.
+
+        Returns:
+            Union[tuple[int, int, int, int], None]: Bounding box of visible
+                pixels of exposure or 'None' if it is fully transparent.
+
+        Raises:
+            ValueError: When image has different resolution than exposures
+                already in the store.
+        """
+        pixels = load_image_pixels(src_filepath)
+        if self._shape is None:
+            self._shape = pixels.shape
+        elif pixels.shape != self._shape:
+            raise ValueError(
+                "Image \"{}\" has different resolution {} than other"
+                " exposures {}.".format(
+                    src_filepath, pixels.shape[:2], self._shape[:2]
+                )
+            )
+        alpha_bbox = get_pixels_alpha_bbox(pixels)
+        if alpha_bbox is None:
+            return None
+        # Offsets are relative to start of file so content of file from
+        #   previous extraction must not be kept
+        mode = "ab" if self._size else "wb"
+        with open(self._filepath, mode) as stream:
+            stream.write(pixels.tobytes())
+        self._offset_by_frame[frame_idx] = self._size
+        self._size += pixels.nbytes
+        return alpha_bbox
+
+    def remove_references(self, references):
+        """Make frames referencing passed exposures transparent.
+
+        Args:
+            references (Iterable[int]): Referenced exposure frames.
+        """
+        self._frame_references = self._frame_references.without_references(
+            references
+        )
+
+    def remove(self):
+        if os.path.exists(self._filepath):
+            os.remove(self._filepath)
+
+    def __getitem__(self, frame_idx):
+        ref_idx = self._frame_references[frame_idx]
+        if ref_idx is None:
+            return None
+        offset = self._offset_by_frame.get(ref_idx)
+        if offset is None:
+            raise ValueError(
+                "Exposure frame {} is not in store \"{}\".".format(
+                    ref_idx, self._filepath
+                )
+            )
+        return StoreFrame(self._filepath, offset, self._shape)
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self._frame_references
+
+    def __iter__(self):
+        return iter(self._frame_references)
+
+    def __len__(self):
+        return len(self._frame_references)
+
+
+class DecodedImageCache:
+    """Least recently used cache of decoded image pixels.
+
+    Held exposures are used as source of many composited frames. Cache
+    makes sure each exposure is decoded only once while it fits into memory.
+
+    Cached pixels must not be modified.
+
+    Args:
+        max_size_mb (int): Maximum size of decoded images in megabytes.
+            Images are not cached if is set to '0'.
+    """
+    def __init__(self, max_size_mb=DEFAULT_IMAGE_CACHE_SIZE_MB):
+        self._max_size = max(0, int(max_size_mb)) * 1024 * 1024
+        self._size = 0
+        self._images = OrderedDict()
+        self._stores = {}
+        self.decode_count = 0
+
+    def get_pixels(self, key, source):
+        """Decoded pixels for the key, image is decoded from source if needed.
+
+        Pixels of frames from layer frame store are not cached as they are
+        read from memory-mapped file without copy.
+
+        Args:
+            key (Hashable): Identifier of image content.
+            source (Union[str, StoreFrame]): Path to image or frame in layer
+                frame store used when image is not cached.
+
+        Returns:
+            np.ndarray: Read-only RGBA pixels with shape (height, width, 4).
+        """
+        if isinstance(source, StoreFrame):
+            return self._get_store_pixels(source)
+
+        item = self._images.get(key)
+        if item is not None:
+            self._images.move_to_end(key)
+            return item
+
+        pixels = load_image_pixels(source)
+        self.decode_count += 1
+
+        if pixels.nbytes > self._max_size:
+            return pixels
+
+        self._images[key] = pixels
+        self._size += pixels.nbytes
+        while self._size > self._max_size:
+            _, removed_pixels = self._images.popitem(last=False)
+            self._size -= removed_pixels.nbytes
+        return pixels
+
+    def discard(self, key):
+        """Remove pixels of the key from cache if they're cached."""
+        pixels = self._images.pop(key, None)
+        if pixels is not None:
+            self._size -= pixels.nbytes
+
+    def _get_store_pixels(self, store_frame):
+        store_pixels = self._stores.get(store_frame.filepath)
+        if store_pixels is None:
+            store_pixels = np.memmap(
+                store_frame.filepath, dtype=np.uint8, mode="r"
+            )
+            self._stores[store_frame.filepath] = store_pixels
+        size = math.prod(store_frame.shape)
+        return store_pixels[
+            store_frame.offset:store_frame.offset + size
+        ].reshape(store_frame.shape)
+
+    def clear(self):
+        self._images.clear()
+        self._stores.clear()
+        self._size = 0
+
+
+class LayerExportStrategy:
+    """Choose how exposure frames of a layer are exported from TVPaint.
+
+    Exposures can be exported one by one with 'tv_saveimage', or the whole
+    range of exposures can be exported with 'tv_savesequence' while only
+    the layer is visible and frames which are not exposures are removed
+    afterwards. Range export is used only for layers with dense exposures
+    and when its estimated duration is shorter.
+
+    Estimates start with default values and are updated with measured
+    durations of exports. Duration of range export is split into overhead
+    per layer and duration per frame by fitting recent measurements.
+
+    Args:
+        min_density (float): Minimum ratio of exposures to frames in range
+            of exposures to consider range export.
+    """
+    EXPOSURES = "exposures"
+    RANGE = "range"
+
+    # Default durations in seconds
+    default_exposure_seconds = 0.05
+    default_range_frame_seconds = 0.03
+    default_range_layer_seconds = 0.5
+    # Weight of new measurement in estimates
+    smoothing = 0.5
+    # Number of recent range exports used to fit range estimates
+    max_range_samples = 10
+
+    def __init__(self, min_density=0.5):
+        self._min_density = min_density
+        self._exposure_seconds = self.default_exposure_seconds
+        self._range_frame_seconds = self.default_range_frame_seconds
+        self._range_layer_seconds = self.default_range_layer_seconds
+        self._range_samples = []
+
+    def choose(self, exposure_count, range_length):
+        """Choose export for a layer.
+
+        Args:
+            exposure_count (int): Number of exposures to export.
+            range_length (int): Number of frames from first to last
+                exposure.
+
+        Returns:
+            str: 'LayerExportStrategy.EXPOSURES' or
+                'LayerExportStrategy.RANGE'.
+        """
+        if exposure_count < 2 or range_length < 1:
+            return self.EXPOSURES
+
+        if exposure_count / range_length < self._min_density:
+            return self.EXPOSURES
+
+        exposures_cost = exposure_count * self._exposure_seconds
+        range_cost = (
+            self._range_layer_seconds
+            + range_length * self._range_frame_seconds
+        )
+        if range_cost < exposures_cost:
+            return self.RANGE
+        return self.EXPOSURES
+
+    def _smooth(self, value, measured):
+        return value + (measured - value) * self.smoothing
+
+    def record_exposures(self, exposure_count, seconds):
+        """Update estimate with duration of exposures export."""
+        if exposure_count > 0:
+            self._exposure_seconds = self._smooth(
+                self._exposure_seconds, seconds / exposure_count
+            )
+
+    def record_range(self, layer_count, frame_count, seconds):
+        """Update estimates with duration of range export.
+
+        Args:
+            layer_count (int): Number of exported layer ranges.
+            frame_count (int): Number of exported frames of all ranges.
+            seconds (float): Duration of the export.
+        """
+        if layer_count < 1 or frame_count < 1:
+            return
+
+        self._range_samples.append((layer_count, frame_count, seconds))
+        del self._range_samples[:-self.max_range_samples]
+
+        fitted = self._fit_range_estimates()
+        if fitted is not None:
+            layer_seconds, frame_seconds = fitted
+            self._range_layer_seconds = self._smooth(
+                self._range_layer_seconds, layer_seconds
+            )
+            self._range_frame_seconds = self._smooth(
+                self._range_frame_seconds, frame_seconds
+            )
+            return
+
+        # Measurements can't be split, layer overhead estimate is kept
+        frames_seconds = max(
+            0.0, seconds - layer_count * self._range_layer_seconds
+        )
+        self._range_frame_seconds = self._smooth(
+            self._range_frame_seconds, frames_seconds / frame_count
+        )
+
+    def _fit_range_estimates(self):
+        """Fit layer overhead and frame duration to range measurements.
+
+        Least squares solution of 'seconds = layers * a + frames * b'.
+
+        Returns:
+            Union[tuple[float, float], None]: Seconds per layer and per
+                frame, or None if measurements don't allow to split them.
+        """
+        s_ll = s_lf = s_ff = s_lt = s_ft = 0.0
+        for layer_count, frame_count, seconds in self._range_samples:
+            s_ll += layer_count * layer_count
+            s_lf += layer_count * frame_count
+            s_ff += frame_count * frame_count
+            s_lt += layer_count * seconds
+            s_ft += frame_count * seconds
+
+        det = s_ll * s_ff - s_lf * s_lf
+        # Measurements with the same ratio of frames to layers
+        if det <= 1e-6 * s_ll * s_ff:
+            return None
+
+        layer_seconds = (s_lt * s_ff - s_ft * s_lf) / det
+        frame_seconds = (s_ll * s_ft - s_lf * s_lt) / det
+        if layer_seconds < 0.0 or frame_seconds < 0.0:
+            return None
+        return layer_seconds, frame_seconds
+
+
+class BackgroundTaskQueue:
+    """Run tasks in background thread with limited number of pending tasks.
+
+    Submitting of a task blocks while the queue is full, so the caller
+    can't get too far ahead of background processing.
+
+    Args:
+        max_pending (int): Maximum number of running and waiting tasks.
+        max_workers (int): Number of background threads.
+    """
+    def __init__(self, max_pending=2, max_workers=1):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="tvpaint_background"
+        )
+        self._semaphore = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        """Number of running and waiting tasks."""
+        with self._lock:
+            return self._pending
+
+    def submit(self, func, *args, **kwargs):
+        """Submit task, waits until there is space in queue.
+
+        Returns:
+            concurrent.futures.Future: Future of the task.
+        """
+        self._semaphore.acquire()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._on_task_done(None)
+            raise
+        future.add_done_callback(self._on_task_done)
+        return future
+
+    def _on_task_done(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._semaphore.release()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Shutdown background threads.
+
+        Args:
+            wait (bool): Wait for running tasks.
+            cancel_futures (bool): Cancel tasks which did not start yet.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+class CompositeFrameCache:
+    """Composited frames of an instance kept between publishes.
+
+    Frames are stored under key calculated from content hashes of source
+    layer frames and their opacity, so a frame is reused on next publish
+    only if its sources did not change. Each instance has own directory
+    in cache root with 'manifest.json' holding hashes of exported
+    exposures and of composited frames.
+
+    Frames not used during publish are removed from instance cache when
+    the cache is saved. If cache root exceeds size limit, directories of
+    least recently published instances are removed first. Frames of
+    current instance are not added once the limit is reached.
+
+    Args:
+        root_dir (str): Root directory of cache shared by all instances.
+        cache_name (str): Name of instance cache directory e.g. hash
+            of workfile path and instance id.
+        max_size_mb (int): Size limit of cache root in MB.
+    """
+    manifest_filename = "manifest.json"
+
+    _active_dirs = set()
+    _active_lock = threading.Lock()
+
+    def __init__(
+        self, root_dir, cache_name, max_size_mb=DEFAULT_FRAME_CACHE_SIZE_MB
+    ):
+        self._root_dir = root_dir
+        self._dirpath = os.path.join(root_dir, cache_name)
+        self._max_size = max(0, int(max_size_mb)) * 1024 * 1024
+        self._lock = threading.Lock()
+        self._exposures = {}
+        self._frames = {}
+        self._used_keys = set()
+        self._new_frames = {}
+        self._new_size = 0
+        self.reused_count = 0
+
+        with self._active_lock:
+            self._active_dirs.add(self._dirpath)
+
+        manifest = self._read_manifest()
+        if manifest.get("version") == FRAME_CACHE_VERSION:
+            self._exposures = manifest.get("exposures") or {}
+            self._frames = manifest.get("frames") or {}
+
+    @staticmethod
+    def get_frame_key(content_hashes, opacities, ext):
+        """Key of composited frame based on its sources.
+
+        Args:
+            content_hashes (Iterable[str]): Content hashes of sources in
+                compositing order.
+            opacities (Iterable[float]): Opacity of sources.
+            ext (str): Extension of output frame.
+
+        Returns:
+            str: Key of frame.
+        """
+        hasher = hashlib.sha1(ext.lower().encode("utf-8"))
+        for content_hash, opacity in zip(content_hashes, opacities):
+            hasher.update(
+                "|{}:{:.6f}".format(content_hash, opacity).encode("utf-8")
+            )
+        return hasher.hexdigest()
+
+    def update_exposures(self, exposure_hashes):
+        """Store hashes of exported exposures.
+
+        Args:
+            exposure_hashes (dict[str, str]): Content hashes by exposure
+                name e.g. '<layer id>:<frame>'.
+
+        Returns:
+            int: Number of exposures changed since previous publish.
+        """
+        changed = sum(
+            1
+            for name, content_hash in exposure_hashes.items()
+            if self._exposures.get(name) != content_hash
+        )
+        self._exposures = dict(exposure_hashes)
+        return changed
+
+    def get_filepath(self, key):
+        """Path to cached frame or 'None' if frame is not cached."""
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return None
+            filepath = os.path.join(self._dirpath, entry["filename"])
+            if not os.path.exists(filepath):
+                return None
+            self._used_keys.add(key)
+            self.reused_count += 1
+        return filepath
+
+    def add(self, key, filepath):
+        """Add composited frame to cache.
+
+        Frame is copied to cache when cache is saved.
+        """
+        with self._lock:
+            if key in self._frames or key in self._new_frames:
+                self._used_keys.add(key)
+                return
+            self._new_frames[key] = filepath
+
+    def save(self):
+        """Copy new frames to cache, write manifest and evict old caches."""
+        try:
+            self._save()
+        except Exception:
+            log.warning("Failed to save composite frame cache.", exc_info=True)
+        finally:
+            with self._active_lock:
+                self._active_dirs.discard(self._dirpath)
+
+    def _save(self):
+        os.makedirs(self._dirpath, exist_ok=True)
+
+        # Remove frames which were not used by this publish
+        frames = {}
+        for key, entry in self._frames.items():
+            filepath = os.path.join(self._dirpath, entry["filename"])
+            if key in self._used_keys:
+                frames[key] = entry
+            elif os.path.exists(filepath):
+                os.remove(filepath)
+
+        self._evict(sum(entry["size"] for entry in frames.values()))
+        size = self._get_dir_size(self._root_dir)
+        for key, src_filepath in self._new_frames.items():
+            if not os.path.exists(src_filepath):
+                continue
+            file_size = os.path.getsize(src_filepath)
+            if size + file_size > self._max_size:
+                break
+            filename = key + os.path.splitext(src_filepath)[-1]
+            shutil.copy(src_filepath, os.path.join(self._dirpath, filename))
+            frames[key] = {"filename": filename, "size": file_size}
+            size += file_size
+
+        self._frames = frames
+        self._new_frames = {}
+        manifest_path = os.path.join(self._dirpath, self.manifest_filename)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as stream:
+            json.dump(
+                {
+                    "version": FRAME_CACHE_VERSION,
+                    "used": time.time(),
+                    "exposures": self._exposures,
+                    "frames": frames,
+                },
+                stream,
+            )
+        os.replace(tmp_path, manifest_path)
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self._dirpath, self.manifest_filename)
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path, "r") as stream:
+                return json.load(stream)
+        except Exception:
+            log.warning("Failed to read composite frame cache manifest.")
+            return {}
+
+    @staticmethod
+    def _get_dir_size(dirpath):
+        size = 0
+        for root, _, filenames in os.walk(dirpath):
+            for filename in filenames:
+                try:
+                    size += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass
+        return size
+
+    def _evict(self, current_size):
+        """Remove least recently published instance caches over limit."""
+        if not os.path.isdir(self._root_dir):
+            return
+        with self._active_lock:
+            active_dirs = set(self._active_dirs)
+
+        other_dirs = []
+        size = current_size
+        for entry in os.scandir(self._root_dir):
+            if not entry.is_dir() or entry.path == self._dirpath:
+                continue
+            dir_size = self._get_dir_size(entry.path)
+            size += dir_size
+            if entry.path in active_dirs:
+                continue
+            manifest_path = os.path.join(entry.path, self.manifest_filename)
+            try:
+                used = os.path.getmtime(manifest_path)
+            except OSError:
+                used = 0
+            other_dirs.append((used, entry.path, dir_size))
+
+        for _, dirpath, dir_size in sorted(other_dirs):
+            if size <= self._max_size:
+                break
+            shutil.rmtree(dirpath, ignore_errors=True)
+            size -= dir_size
+
+
+class ExtractionCheckpoint:
+    """Manifest of finished extraction work stored in staging directory.
+
+    Extraction is split into stages (e.g. sequence, exr conversion) and
+    files of a stage are recorded in batches when they're finished, so a
+    publish which failed on the way can continue where it stopped. Recorded
+    files are reused only if they still exist with recorded size.
+
+    Manifest is reset when signature of extraction changes, stage is reset
+    when its signature changes.
+
+    Args:
+        dirpath (str): Staging directory where manifest is stored.
+    """
+    manifest_filename = "tvpaint_checkpoint.json"
+
+    def __init__(self, dirpath):
+        self._dirpath = dirpath
+        self._manifest_path = os.path.join(dirpath, self.manifest_filename)
+        self._lock = threading.Lock()
+        self._data = self._read()
+
+    @property
+    def dirpath(self):
+        return self._dirpath
+
+    def validate(self, signature):
+        """Reset manifest if signature does not match.
+
+        Args:
+            signature (str): Signature of extraction inputs.
+
+        Returns:
+            bool: Manifest matches the signature.
+        """
+        with self._lock:
+            if self._data.get("signature") == signature:
+                return True
+            self._data = {
+                "version": CHECKPOINT_VERSION,
+                "signature": signature,
+                "stages": {},
+            }
+            self._write()
+        return False
+
+    def start_stage(self, stage, signature=None):
+        """Reset stage if its signature does not match."""
+        with self._lock:
+            stages = self._data.setdefault("stages", {})
+            stage_data = stages.get(stage)
+            if stage_data is None or stage_data["signature"] != signature:
+                stages[stage] = {
+                    "signature": signature,
+                    "done": False,
+                    "files": {},
+                }
+                self._write()
+
+    def get_verified_files(self, stage):
+        """Recorded files of stage that still exist with recorded size.
+
+        Files which do not verify are removed from manifest.
+
+        Returns:
+            set[str]: Filenames relative to staging directory.
+        """
+        with self._lock:
+            stage_data = self._data.get("stages", {}).get(stage)
+            if not stage_data:
+                return set()
+
+            verified = set()
+            for filename, size in tuple(stage_data["files"].items()):
+                filepath = os.path.join(self._dirpath, filename)
+                try:
+                    file_size = os.path.getsize(filepath)
+                except OSError:
+                    file_size = None
+                if file_size == size:
+                    verified.add(filename)
+                else:
+                    stage_data["files"].pop(filename)
+                    stage_data["done"] = False
+            return verified
+
+    def add_files(self, stage, filepaths):
+        """Record finished files of stage and write manifest."""
+        with self._lock:
+            stage_data = self._data["stages"][stage]
+            for filepath in filepaths:
+                stage_data["files"][os.path.basename(filepath)] = (
+                    os.path.getsize(filepath)
+                )
+            self._write()
+
+    def remove_unrecorded_files(self, filenames=None, patterns=None):
+        """Remove files of extraction which are not recorded in manifest.
+
+        Intermediate files of interrupted extraction (e.g. layer frames)
+        can't be reused because it's unknown whether they were finished.
+        Only passed filenames and names matching passed patterns are
+        removed, other content of staging directory is never touched.
+
+        Args:
+            filenames (Optional[Iterable[str]]): Names of files created by
+                extraction, e.g. output frames.
+            patterns (Optional[Iterable[str]]): 'fnmatch' patterns of
+                names of intermediate files and directories.
+        """
+        filenames = set(filenames or [])
+        patterns = list(patterns or [])
+        with self._lock:
+            recorded = {self.manifest_filename}
+            for stage_data in self._data.get("stages", {}).values():
+                recorded.update(stage_data["files"])
+
+        for name in os.listdir(self._dirpath):
+            if name in recorded:
+                continue
+            if name not in filenames and not any(
+                fnmatch.fnmatch(name, pattern)
+                for pattern in patterns
+            ):
+                continue
+            path = os.path.join(self._dirpath, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    def is_stage_done(self, stage):
+        with self._lock:
+            stage_data = self._data.get("stages", {}).get(stage)
+            return bool(stage_data and stage_data["done"])
+
+    def finish_stage(self, stage):
+        with self._lock:
+            self._data["stages"][stage]["done"] = True
+            self._write()
+
+    def _read(self):
+        if not os.path.exists(self._manifest_path):
+            return {}
+        try:
+            with open(self._manifest_path, "r") as stream:
+                data = json.load(stream)
+        except Exception:
+            log.warning("Failed to read extraction checkpoint.")
+            return {}
+        if data.get("version") != CHECKPOINT_VERSION:
+            return {}
+        return data
+
+    def _write(self):
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w") as stream:
+            json.dump(self._data, stream)
+        os.replace(tmp_path, self._manifest_path)
+
+
+class ReviewVideoEncoder:
+    """Encode frames to review video by piping raw RGB to ffmpeg.
+
+    Frames are composited over background color before they're written, so
+    review doesn't have to read output images back. Process is started
+    with first frame when size of frames is known.
+
+    Args:
+        ffmpeg_args (list[str]): Arguments to launch ffmpeg executable.
+        output_path (str): Path to output video.
+        fps (float): Frame rate of video.
+        bg_color (tuple[int, int, int]): Background color.
+        crf (int): Constant rate factor of H.264 encoding.
+    """
+    def __init__(self, ffmpeg_args, output_path, fps, bg_color, crf=18):
+        self._ffmpeg_args = list(ffmpeg_args)
+        self._output_path = output_path
+        self._fps = fps
+        self._bg_color = np.array(bg_color[:3], dtype=np.uint16)
+        self._crf = crf
+        self._process = None
+        self._stderr = None
+        self._size = None
+        self._last_pixels = None
+        self._last_data = None
+        self.frame_count = 0
+
+    @property
+    def output_path(self):
+        return self._output_path
+
+    @property
+    def size(self):
+        """Width and height of frames or 'None' if nothing was written."""
+        return self._size
+
+    def write_frame(self, pixels):
+        """Write RGBA frame, the same pixels object is converted only once.
+
+        Args:
+            pixels (np.ndarray): RGBA uint8 pixels.
+        """
+        if pixels is not self._last_pixels:
+            self._last_data = self._flatten(pixels).tobytes()
+            self._last_pixels = pixels
+
+        if self._process is None:
+            height, width = pixels.shape[:2]
+            self._start(width, height)
+        self._process.stdin.write(self._last_data)
+        self.frame_count += 1
+
+    def close(self):
+        """Finish encoding.
+
+        Raises:
+            RuntimeError: When ffmpeg failed.
+        """
+        self._release_pixels()
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        process.stdin.close()
+        returncode = process.wait()
+        self._stderr.seek(0)
+        output = self._stderr.read().decode("utf-8", errors="replace")
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(
+                "Encoding of review failed with code {}: {}".format(
+                    returncode, output
+                )
+            )
+
+    def abort(self):
+        """Stop encoding without waiting for output."""
+        self._release_pixels()
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        process.kill()
+        process.wait()
+        self._stderr.close()
+
+    def _release_pixels(self):
+        # Pixels may be memory mapped from files which are removed later
+        self._last_pixels = None
+        self._last_data = None
+
+    def _flatten(self, pixels):
+        alpha = pixels[..., 3:].astype(np.uint16)
+        rgb = (
+            pixels[..., :3] * alpha
+            + self._bg_color * (255 - alpha)
+            + 127
+        ) // 255
+        return rgb.astype(np.uint8)
+
+    def _start(self, width, height):
+        self._size = (width, height)
+        self._stderr = tempfile.TemporaryFile()
+        args = self._ffmpeg_args + [
+            "-y",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", "{}x{}".format(width, height),
+            "-r", str(self._fps),
+            "-i", "-",
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p",
+            "-c:v", "libx264",
+            "-crf", str(self._crf),
+            self._output_path,
+        ]
+        self._process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._stderr,
+        )
+
+
+class _OrderedFrameSink:
+    """Pass frames to encoder in frame order.
+
+    Composited frames may be received in other order than they are in
+    output, and some frames are not composited at all (e.g. copied or
+    transparent frames). Those are read from their output files.
+
+    Args:
+        encoder (ReviewVideoEncoder): Encoder receiving frames.
+        frame_sources (list[Union[str, None]]): Output filepath with pixels
+            of each frame in order, 'None' for transparent frame.
+        composited_filepaths (Iterable[str]): Filepaths which are
+            composited, their pixels are received with 'add'.
+        transparent_size (Optional[tuple[int, int]]): Size of transparent
+            frames before size of other frames is known.
+    """
+    def __init__(
+        self,
+        encoder,
+        frame_sources,
+        composited_filepaths,
+        transparent_size=None,
+    ):
+        self._encoder = encoder
+        self._frame_sources = frame_sources
+        self._composited_filepaths = set(composited_filepaths)
+        self._transparent_size = transparent_size
+        self._last_use = {
+            filepath: idx
+            for idx, filepath in enumerate(frame_sources)
+        }
+        self._pixels = {}
+        self._next_idx = 0
+        self._last_loaded = (None, None)
+        self._transparent = None
+
+    def add(self, filepath, pixels):
+        if filepath in self._last_use:
+            self._pixels[filepath] = pixels
+        self._write_available()
+
+    def finish(self):
+        self._write_available()
+        if self._next_idx < len(self._frame_sources):
+            raise ValueError("Not all frames were passed to encoder.")
+
+    def _get_transparent(self):
+        if self._transparent is None:
+            size = self._encoder.size or self._transparent_size
+            if size is None:
+                raise ValueError(
+                    "All frames are transparent and size of image"
+                    " is not known."
+                )
+            width, height = size
+            self._transparent = np.zeros((height, width, 4), dtype=np.uint8)
+        return self._transparent
+
+    def _write_available(self):
+        while self._next_idx < len(self._frame_sources):
+            filepath = self._frame_sources[self._next_idx]
+            if filepath is None:
+                pixels = self._get_transparent()
+            elif filepath in self._composited_filepaths:
+                pixels = self._pixels.get(filepath)
+                if pixels is None:
+                    return
+            elif self._last_loaded[0] == filepath:
+                pixels = self._last_loaded[1]
+            else:
+                pixels = load_image_pixels(filepath)
+                self._last_loaded = (filepath, pixels)
+
+            self._encoder.write_frame(pixels)
+            if self._last_use[filepath] == self._next_idx:
+                self._pixels.pop(filepath, None)
+            self._next_idx += 1
 
 
 def cleanup_rendered_layers(filepaths_by_layer_id):
@@ -546,6 +2375,9 @@ def cleanup_rendered_layers(filepaths_by_layer_id):
     # Collect all filepaths from data
     all_filepaths = []
     for filepaths_by_frame in filepaths_by_layer_id.values():
+        if isinstance(filepaths_by_frame, LayerFrameStore):
+            filepaths_by_frame.remove()
+            continue
         all_filepaths.extend(filepaths_by_frame.values())
 
     # Loop over loop
@@ -561,12 +2393,27 @@ def composite_rendered_layers(
     range_end,
     dst_filepaths_by_frame,
     cleanup=True,
+    frame_references_by_layer_id=None,
+    image_cache_size_mb=DEFAULT_IMAGE_CACHE_SIZE_MB,
+    max_workers=1,
+    opacity_by_layer_id=None,
+    transparent_size=None,
+    alpha_bboxes_by_layer_id=None,
+    prefix_cache_size_mb=DEFAULT_PREFIX_CACHE_SIZE_MB,
+    stripe_height=0,
+    frame_cache=None,
+    content_hashes_by_layer_id=None,
+    skip_frames=None,
+    on_frames_done=None,
+    review_encoder=None,
+    image_cache=None,
 ):
     """Composite multiple rendered layers by their position.
 
     Result is single frame sequence with transparency matching content
     created in TVPaint. Missing source filepaths are replaced with transparent
-    images but at least one image must be rendered and exist.
+    images. At least one image must be rendered and exist, or
+    'transparent_size' must be passed.
 
     Function can be used even if single layer was created to fill transparent
     filepaths.
@@ -574,15 +2421,85 @@ def composite_rendered_layers(
     Args:
         layers_data(list): Layers data loaded from TVPaint.
         filepaths_by_layer_id(dict): Rendered filepaths stored by frame index
-            per layer id. Used as source for compositing.
+            per layer id, or 'LayerFrameStore' of the layer. Used as source
+            for compositing.
         range_start(int): First frame of rendered range.
         range_end(int): Last frame of rendered range.
         dst_filepaths_by_frame(dict): Output filepaths by frame where final
             image after compositing will be stored. Path must not clash with
             source filepaths.
         cleanup(bool): Remove all source filepaths when done with compositing.
+        frame_references_by_layer_id(Optional[dict]): Frame references
+            per layer id. Frames composited from the same referenced frames
+            are composited only once and copied to other frames and
+            decoded source images are shared by frames in cache.
+        image_cache_size_mb(int): Maximum size of decoded source images
+            kept in memory in MB. The size is used by each process.
+        max_workers(int): Number of processes used for compositing. Number
+            of CPUs is used when set to '0' or 'None'. Frames are composited
+            in current process when set to '1'. Worker processes are started
+            with default start method of platform ('spawn' on Windows and
+            macOS), so each worker starts a new Python interpreter and
+            imports this module.
+        opacity_by_layer_id(Optional[dict[int, float]]): Opacity of layers
+            in range 0.0-1.0 applied during compositing. Layers without
+            opacity are fully opaque.
+        transparent_size(Optional[tuple[int, int]]): Width and height of
+            transparent images used when no frame has any source.
+        alpha_bboxes_by_layer_id(Optional[dict[int, dict[int, tuple]]]):
+            Bounding boxes of visible pixels by referenced frame per layer
+            id. Only region inside bounding box of a source is blended.
+        prefix_cache_size_mb(int): Maximum size of partial composites of
+            bottom layers kept in memory in MB. The size is used by each
+            process.
+        stripe_height(int): Composite frames by horizontal stripes with
+            this number of rows and stream them to output. Used only for
+            frames with all sources in 'LayerFrameStore'. Disabled when set
+            to '0'.
+        frame_cache(Optional[CompositeFrameCache]): Cache of composited
+            frames from previous publishes. Cached frames are reused and
+            newly composited frames are added to the cache. Requires frame
+            references and content hashes.
+        content_hashes_by_layer_id(Optional[dict[int, dict[int, str]]]):
+            Content hashes of sources by referenced frame per layer id.
+        skip_frames(Optional[set[int]]): Frames with already existing
+            output which are not composited.
+        on_frames_done(Optional[Callable[[list[str]], None]]): Called with
+            output filepaths of each finished batch of frames.
+        review_encoder(Optional[ReviewVideoEncoder]): Encoder receiving
+            all output frames in order. Frames are composited in current
+            process when passed, so they can be streamed to the encoder.
+            Encoder is closed before source files are removed.
+        image_cache(Optional[DecodedImageCache]): Cache with pixels of
+            sources decoded before compositing, keyed by layer id and
+            referenced frame. Used only when compositing in current
+            process.
+
+    Source images can have different format than output images, sources
+    are converted to output format in that case.
+
+    Returns:
+        list[tuple[int, int]]: Exposures of output frames as first frame
+            and duration. Consecutive frames composited from the same
+            sources are one exposure, skipped frames are always new
+            exposure.
 
     """
+    if frame_references_by_layer_id is None:
+        frame_references_by_layer_id = {}
+
+    if opacity_by_layer_id is None:
+        opacity_by_layer_id = {}
+
+    if alpha_bboxes_by_layer_id is None:
+        alpha_bboxes_by_layer_id = {}
+
+    if content_hashes_by_layer_id is None:
+        content_hashes_by_layer_id = {}
+
+    if skip_frames is None:
+        skip_frames = set()
+
     # Prepare layers by their position
     #   - position tells in which order will compositing happen
     layer_ids_by_position = {}
@@ -595,50 +2512,381 @@ def composite_rendered_layers(
     # Prepare variable where filepaths without any rendered content
     #   - transparent will be created
     transparent_filepaths = set()
+    # Composited filepaths by referenced source frames
+    # - held frames in all layers lead to the same result
+    dst_filepath_by_key = {}
+    # Frames with the same sources as already composited frame
+    duplicated_filepaths = []
+    # Frames that need compositing of multiple sources
+    composite_jobs = []
+    # Frames to add to frame cache by cache key
+    frame_cache_keys = {}
+    # Frames finished without compositing
+    done_filepaths = []
+    # Filepath with pixels of each frame passed to review encoder
+    encoder_sources = []
+    # Consecutive frames with the same sources
+    exposures = []
+    last_composite_key = None
     # Store first final filepath
     first_dst_filepath = None
     for frame_idx in range(range_start, range_end + 1):
         dst_filepath = dst_filepaths_by_frame[frame_idx]
+        encoder_sources.append(dst_filepath)
+        if frame_idx in skip_frames:
+            # Sources of existing frame are not known
+            exposures.append((frame_idx, 1))
+            last_composite_key = None
+            # Existing frame can be used as source for transparent images
+            if first_dst_filepath is None:
+                first_dst_filepath = dst_filepath
+            continue
+
         src_filepaths = []
+        src_opacities = []
+        src_bboxes = []
+        src_hashes = []
+        composite_key = []
         for layer_position in sorted_positions:
             layer_id = layer_ids_by_position[layer_position]
             filepaths_by_frame = filepaths_by_layer_id[layer_id]
             src_filepath = filepaths_by_frame.get(frame_idx)
-            if src_filepath is not None:
-                src_filepaths.append(src_filepath)
+            if src_filepath is None:
+                continue
+            src_filepaths.append(src_filepath)
+            src_opacities.append(opacity_by_layer_id.get(layer_id, 1.0))
+            frame_references = frame_references_by_layer_id.get(layer_id)
+            src_bbox = None
+            if frame_references is not None:
+                ref_idx = frame_references[frame_idx]
+                composite_key.append((layer_id, ref_idx))
+                alpha_bboxes = alpha_bboxes_by_layer_id.get(layer_id)
+                if alpha_bboxes:
+                    src_bbox = alpha_bboxes.get(ref_idx)
+                content_hashes = content_hashes_by_layer_id.get(layer_id)
+                if content_hashes:
+                    src_hashes.append(content_hashes.get(ref_idx))
+            else:
+                composite_key.append((layer_id, src_filepath))
+            src_bboxes.append(src_bbox)
+
+        composite_key = tuple(composite_key)
+        if composite_key == last_composite_key:
+            first_frame_idx, duration = exposures[-1]
+            exposures[-1] = (first_frame_idx, duration + 1)
+        else:
+            exposures.append((frame_idx, 1))
+            last_composite_key = composite_key
 
         if not src_filepaths:
             transparent_filepaths.add(dst_filepath)
+            encoder_sources[-1] = None
+            continue
+
+        composited_filepath = dst_filepath_by_key.get(composite_key)
+        if composited_filepath is not None:
+            duplicated_filepaths.append((composited_filepath, dst_filepath))
+            encoder_sources[-1] = composited_filepath
             continue
+        dst_filepath_by_key[composite_key] = dst_filepath
 
         # Store first destination filepath to be used for transparent images
         if first_dst_filepath is None:
             first_dst_filepath = dst_filepath
 
-        if len(src_filepaths) == 1:
+        # Reuse frame composited by previous publish
+        if (
+            frame_cache is not None
+            and len(src_hashes) == len(src_filepaths)
+            and None not in src_hashes
+        ):
+            frame_cache_key = frame_cache.get_frame_key(
+                src_hashes,
+                src_opacities,
+                os.path.splitext(dst_filepath)[-1],
+            )
+            cached_filepath = frame_cache.get_filepath(frame_cache_key)
+            if cached_filepath is not None:
+                shutil.copy(cached_filepath, dst_filepath)
+                done_filepaths.append(dst_filepath)
+                continue
+            frame_cache_keys[frame_cache_key] = dst_filepath
+
+        # Single opaque source of the same format can be used as is
+        if (
+            len(src_filepaths) == 1
+            and src_opacities[0] == 1.0
+            and isinstance(src_filepaths[0], str)
+            and _has_same_ext(src_filepaths[0], dst_filepath)
+        ):
             src_filepath = src_filepaths[0]
             if cleanup:
                 os.rename(src_filepath, dst_filepath)
             else:
                 copy_render_file(src_filepath, dst_filepath)
+            done_filepaths.append(dst_filepath)
 
         else:
-            composite_images(src_filepaths, dst_filepath)
+            composite_jobs.append((
+                dst_filepath,
+                list(zip(
+                    composite_key, src_filepaths, src_opacities, src_bboxes
+                ))
+            ))
+
+    if on_frames_done is not None and done_filepaths:
+        on_frames_done(done_filepaths)
+
+    frame_sink = None
+    if review_encoder is not None:
+        frame_sink = _OrderedFrameSink(
+            review_encoder,
+            encoder_sources,
+            [dst_filepath for dst_filepath, _ in composite_jobs],
+            transparent_size,
+        )
+
+    _run_composite_jobs(
+        composite_jobs,
+        image_cache_size_mb,
+        max_workers,
+        prefix_cache_size_mb,
+        stripe_height,
+        on_frames_done,
+        frame_sink,
+        image_cache,
+    )
+    if frame_sink is not None:
+        frame_sink.finish()
+        # Release pixels which may be views of layer files before cleanup
+        frame_sink = None
+        review_encoder.close()
+
+    done_filepaths = []
+    for src_filepath, dst_filepath in duplicated_filepaths:
+        copy_render_file(src_filepath, dst_filepath)
+        done_filepaths.append(dst_filepath)
+
+    if frame_cache is not None:
+        for frame_cache_key, dst_filepath in frame_cache_keys.items():
+            frame_cache.add(frame_cache_key, dst_filepath)
 
     # Store first transparent filepath to be able copy it
     transparent_filepath = None
     for dst_filepath in transparent_filepaths:
-        if transparent_filepath is None:
+        if transparent_filepath is not None:
+            copy_render_file(transparent_filepath, dst_filepath)
+            continue
+
+        if first_dst_filepath is not None:
             create_transparent_image_from_source(
                 first_dst_filepath, dst_filepath
             )
-            transparent_filepath = dst_filepath
+        elif transparent_size is not None:
+            create_transparent_image(*transparent_size, dst_filepath)
         else:
-            copy_render_file(transparent_filepath, dst_filepath)
+            raise ValueError(
+                "All frames are transparent and size of image is not known."
+            )
+        transparent_filepath = dst_filepath
+
+    if on_frames_done is not None:
+        done_filepaths.extend(transparent_filepaths)
+        if done_filepaths:
+            on_frames_done(done_filepaths)
 
     # Remove all files that were used as source for compositing
     if cleanup:
         cleanup_rendered_layers(filepaths_by_layer_id)
+    return exposures
+
+
+def _has_same_ext(src_filepath, dst_filepath):
+    return (
+        os.path.splitext(src_filepath)[-1].lower()
+        == os.path.splitext(dst_filepath)[-1].lower()
+    )
+
+
+def _get_common_prefix_length(keys, other_keys):
+    length = 0
+    for key, other_key in zip(keys, other_keys):
+        if key != other_key:
+            break
+        length += 1
+    return length
+
+
+def _composite_frames(
+    composite_jobs,
+    image_cache_size_mb,
+    prefix_cache_size_mb=DEFAULT_PREFIX_CACHE_SIZE_MB,
+    stripe_height=0,
+    frame_sink=None,
+    image_cache=None,
+):
+    """Composite frames from their sources.
+
+    Function is used in worker processes so it must stay on module level.
+
+    Bottom sources shared with previous frame are cached as partial
+    composite, so following frames with the same bottom sources blend only
+    the sources above them.
+
+    Args:
+        composite_jobs (list[tuple[str, list[tuple]]]): Output filepath
+            with source images from bottom to top. Each source has key of
+            its content, filepath or 'StoreFrame', opacity and bounding box
+            of visible pixels (can be 'None').
+        image_cache_size_mb (int): Maximum size of decoded images cache.
+        prefix_cache_size_mb (int): Maximum size of partial composites
+            cache.
+        stripe_height (int): Frames with all sources in layer frame store
+            are composited by stripes with this number of rows. Disabled
+            when set to '0'.
+        frame_sink (Optional[_OrderedFrameSink]): Receives pixels of each
+            composited frame. Frames are not composited by stripes when
+            passed. Can be used only in current process.
+        image_cache (Optional[DecodedImageCache]): Cache of decoded images
+            used instead of new cache. Passed cache is not cleared. Can be
+            used only in current process.
+    """
+    if frame_sink is not None:
+        stripe_height = 0
+    clear_image_cache = image_cache is None
+    if image_cache is None:
+        image_cache = DecodedImageCache(image_cache_size_mb)
+    prefix_cache = PrefixCompositeCache(prefix_cache_size_mb)
+    previous_keys = ()
+    for dst_filepath, sources in composite_jobs:
+        if stripe_height and all(
+            isinstance(source[1], StoreFrame)
+            for source in sources
+        ):
+            _composite_frame_in_stripes(
+                dst_filepath, sources, image_cache, stripe_height
+            )
+            continue
+
+        if len(sources) == 1 and sources[0][2] == 1.0:
+            # Single opaque source is only converted to output format
+            src_key, src_filepath, _, _ = sources[0]
+            pixels = image_cache.get_pixels(src_key, src_filepath)
+            Image.fromarray(pixels, "RGBA").save(dst_filepath)
+            if frame_sink is not None:
+                frame_sink.add(dst_filepath, pixels)
+            continue
+
+        keys = tuple(source[0] for source in sources)
+        start_idx, state = prefix_cache.get_deepest(keys)
+        # Store bottom sources shared with previous frame as they are
+        #   probably shared with next frames too
+        store_depth = _get_common_prefix_length(keys, previous_keys)
+        previous_keys = keys
+        for idx in range(start_idx, len(sources)):
+            if idx == store_depth and idx > start_idx:
+                prefix_cache.add(keys[:idx], state)
+            src_key, src_filepath, opacity, bbox = sources[idx]
+            state = _blend_source(
+                state,
+                image_cache.get_pixels(src_key, src_filepath),
+                opacity,
+                bbox,
+            )
+        pixels = _finish_composite(state)
+        Image.fromarray(pixels, "RGBA").save(dst_filepath)
+        if frame_sink is not None:
+            frame_sink.add(dst_filepath, pixels)
+    prefix_cache.clear()
+    if clear_image_cache:
+        image_cache.clear()
+
+
+def _run_composite_jobs(
+    composite_jobs,
+    image_cache_size_mb,
+    max_workers,
+    prefix_cache_size_mb=DEFAULT_PREFIX_CACHE_SIZE_MB,
+    stripe_height=0,
+    on_frames_done=None,
+    frame_sink=None,
+    image_cache=None,
+):
+    if not composite_jobs:
+        return
+
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+    # Each worker should get multiple chunks to balance the load
+    chunk_count = max_workers * COMPOSITE_CHUNKS_PER_WORKER
+    chunk_size = max(
+        COMPOSITE_MIN_CHUNK_SIZE,
+        int(math.ceil(len(composite_jobs) / chunk_count))
+    )
+    # Contiguous chunks of frames share the most of held sources
+    chunks = [
+        composite_jobs[idx:idx + chunk_size]
+        for idx in range(0, len(composite_jobs), chunk_size)
+    ]
+    max_workers = min(max_workers, len(chunks))
+    # Frames are streamed to sink in order from current process
+    if max_workers < 2 or frame_sink is not None:
+        # Caches are shared by all frames when progress is not reported
+        if on_frames_done is None:
+            chunks = [composite_jobs]
+        for chunk in chunks:
+            _composite_frames(
+                chunk,
+                image_cache_size_mb,
+                prefix_cache_size_mb,
+                stripe_height,
+                frame_sink,
+                image_cache,
+            )
+            _report_frames_done(chunk, on_frames_done)
+        return
+
+    # Cache sizes are budgets per process, splitting them between workers
+    #   could make them too small to hold a single frame
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks_by_future = {
+                executor.submit(
+                    _composite_frames,
+                    chunk,
+                    image_cache_size_mb,
+                    prefix_cache_size_mb,
+                    stripe_height,
+                ): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(chunks_by_future):
+                future.result()
+                _report_frames_done(
+                    chunks_by_future[future], on_frames_done
+                )
+
+    except BrokenProcessPool:
+        # Process pool may not be available in some environments
+        #   e.g. when worker processes can't be started
+        log.warning(
+            "Failed to composite frames in worker processes."
+            " Compositing frames in current process.",
+            exc_info=True
+        )
+        _composite_frames(
+            composite_jobs,
+            image_cache_size_mb,
+            prefix_cache_size_mb,
+            stripe_height,
+            image_cache=image_cache,
+        )
+        _report_frames_done(composite_jobs, on_frames_done)
+
+
+def _report_frames_done(composite_jobs, on_frames_done):
+    if on_frames_done is not None:
+        on_frames_done([dst_filepath for dst_filepath, _ in composite_jobs])
 
 
 def composite_images(input_image_paths, output_filepath):
@@ -650,14 +2898,11 @@ def composite_images(input_image_paths, output_filepath):
     if not input_image_paths:
         raise ValueError("Nothing to composite.")
 
-    img_obj = None
-    for image_filepath in input_image_paths:
-        _img_obj = Image.open(image_filepath)
-        if img_obj is None:
-            img_obj = _img_obj
-        else:
-            img_obj.alpha_composite(_img_obj)
-    img_obj.save(output_filepath)
+    pixels = composite_pixels(
+        (load_image_pixels(image_filepath), 1.0)
+        for image_filepath in input_image_paths
+    )
+    Image.fromarray(pixels, "RGBA").save(output_filepath)
 
 
 def rename_filepaths_by_frame_start(
@@ -13,9 +13,6 @@ from ayon_core.pipeline.workfile import (
 )
 from ayon_core.pipeline.template_data import get_template_data_with_names
 from ayon_tvpaint.api import plugin
-from ayon_tvpaint.api.lib import (
-    execute_george_through_file,
-)
 from ayon_tvpaint.api.pipeline import (
     get_current_workfile_context,
 )
@@ -45,10 +42,8 @@ class LoadWorkfile(plugin.Loader):
         current_file = host.get_current_workfile()
         work_context = get_current_workfile_context()
 
-        george_script = "tv_LoadProject '\"'\"{}\"'\"'".format(
-            filepath
-        )
-        execute_george_through_file(george_script)
+        # Open through host so cached workfile data are invalidated
+        host.open_workfile(filepath)
 
         # Save workfile.
         host_name = "tvpaint"
@@ -7,6 +7,7 @@ Requires:
 from __future__ import annotations
 
 import os
+import hashlib
 import collections
 import copy
 from typing import Optional
@@ -169,6 +170,9 @@ class ExtractConvertToEXR(pyblish.api.ContextPlugin):
 
     user_overrides = []
 
+    # Number of converted frames recorded to checkpoint at once
+    checkpoint_batch_size = 50
+
     def process(self, context):
         exr_data = context.data["convertExrData"]
         exr_user_value = exr_data["user_value"]
@@ -271,9 +275,22 @@ class ExtractConvertToEXR(pyblish.api.ContextPlugin):
         src_filepaths = set()
         new_filenames = []
 
+        # Frames converted by previous publish can be skipped
+        checkpoint = instance.data.get("tvpaintCheckpoint")
+        verified_filenames = set()
+        if checkpoint is not None:
+            checkpoint.start_stage(
+                "exr",
+                self._get_checkpoint_signature(
+                    src_filepaths=self._get_repre_filepaths(repre)
+                )
+            )
+            verified_filenames = checkpoint.get_verified_files("exr")
+
         output_arg = "-o"
         if self.auto_trim:
             output_arg = "-o:autotrim=1"
+        converted_filepaths = []
         for src_filename in repre["files"]:
             dst_filename = os.path.splitext(src_filename)[0] + ".exr"
             new_filenames.append(dst_filename)
@@ -282,6 +299,8 @@ class ExtractConvertToEXR(pyblish.api.ContextPlugin):
             dst_filepath = os.path.join(repre["stagingDir"], dst_filename)
 
             src_filepaths.add(src_filepath)
+            if dst_filename in verified_filenames:
+                continue
 
             args = copy.deepcopy(base_oiio_args)
             args.extend([
@@ -292,6 +311,18 @@ class ExtractConvertToEXR(pyblish.api.ContextPlugin):
             ])
             run_subprocess(args)
 
+            if checkpoint is None:
+                continue
+            converted_filepaths.append(dst_filepath)
+            if len(converted_filepaths) >= self.checkpoint_batch_size:
+                checkpoint.add_files("exr", converted_filepaths)
+                converted_filepaths = []
+
+        if checkpoint is not None:
+            if converted_filepaths:
+                checkpoint.add_files("exr", converted_filepaths)
+            checkpoint.finish_stage("exr")
+
         repres.append(
             {
                 "name": "exr",
@@ -308,6 +339,39 @@ class ExtractConvertToEXR(pyblish.api.ContextPlugin):
             for filepath in src_filepaths:
                 instance.context.data["cleanupFullPaths"].append(filepath)
 
+    def _get_checkpoint_signature(
+        self, product_names=None, src_filepaths=None
+    ):
+        """Signature of conversion stored in checkpoint.
+
+        Signature contains conversion settings and size and modification
+        time of source files, so files composited again by resumed
+        extraction are converted again.
+        """
+        parts = [self.exr_compression, str(self.auto_trim)]
+        if product_names is not None:
+            parts.extend(sorted(product_names))
+        if src_filepaths is not None:
+            sources_hash = hashlib.sha1()
+            for filepath in sorted(src_filepaths):
+                stat = os.stat(filepath)
+                sources_hash.update("{}|{}|{}\n".format(
+                    os.path.basename(filepath),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                ).encode("utf-8"))
+            parts.append(sources_hash.hexdigest())
+        return "|".join(parts)
+
+    def _get_repre_filepaths(self, repre):
+        filenames = repre["files"]
+        if not isinstance(filenames, list):
+            filenames = [filenames]
+        return [
+            os.path.join(repre["stagingDir"], filename)
+            for filename in filenames
+        ]
+
     def _multichannel_exr_conversion(
         self,
         render_layer_items,
@@ -401,8 +465,54 @@ class ExtractConvertToEXR(pyblish.api.ContextPlugin):
                 "-d", "uint8",
                 output_arg, dst_path,
             ])
-            self.log.debug("Running oiiotool with args: %s", args)
-            run_subprocess(args)
+
+            # Sequence is converted with single call so it's skipped only
+            #   if all files were converted by previous publish
+            checkpoint = render_layer_instance.data.get("tvpaintCheckpoint")
+            dst_filenames = dst_filename
+            if not isinstance(dst_filenames, list):
+                dst_filenames = [dst_filenames]
+            is_converted = False
+            if checkpoint is not None:
+                src_filepaths = self._get_repre_filepaths(src_layer_repre)
+                for _, pass_repre in render_pass_items:
+                    src_filepaths.extend(
+                        self._get_repre_filepaths(pass_repre)
+                    )
+                checkpoint.start_stage(
+                    "exr_multichannel",
+                    self._get_checkpoint_signature(
+                        (
+                            render_pass_instance.data["productName"]
+                            for render_pass_instance, _ in render_pass_items
+                        ),
+                        src_filepaths=src_filepaths,
+                    )
+                )
+                verified_filenames = checkpoint.get_verified_files(
+                    "exr_multichannel"
+                )
+                is_converted = (
+                    checkpoint.is_stage_done("exr_multichannel")
+                    and verified_filenames.issuperset(dst_filenames)
+                )
+
+            if is_converted:
+                self.log.debug(
+                    "Using EXR files converted by previous publish."
+                )
+            else:
+                self.log.debug("Running oiiotool with args: %s", args)
+                run_subprocess(args)
+                if checkpoint is not None:
+                    checkpoint.add_files(
+                        "exr_multichannel",
+                        [
+                            os.path.join(layer_staging_dir, filename)
+                            for filename in dst_filenames
+                        ]
+                    )
+                    checkpoint.finish_stage("exr_multichannel")
 
             layer_repres = render_layer_instance.data["representations"]
             layer_repres.append(
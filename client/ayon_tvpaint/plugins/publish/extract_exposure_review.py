@@ -0,0 +1,130 @@
+"""Plugin encoding review from unique frames of PNG sequence.
+
+Requires:
+    ExtractSequence - source of PNG and exposure timing in instance data
+
+Provides:
+    Video representation for ExtractReview which is encoded only from unique
+        frames with their durations, held frames are not decoded and encoded
+        again.
+"""
+import os
+
+import pyblish.api
+
+from ayon_core.lib import get_ffmpeg_tool_args, run_subprocess
+
+
+class ExtractExposureReview(pyblish.api.InstancePlugin):
+    # Offset to get after ExtractSequenceFinish and before ExtractReview
+    order = pyblish.api.ExtractorOrder + 0.015
+    label = "Extract Exposure Review"
+    hosts = ["tvpaint"]
+    families = ["review", "render"]
+
+    settings_category = "tvpaint"
+
+    enabled = False
+
+    # Tags of created video representation
+    output_tags = ["review", "delete"]
+    crf = 18
+
+    def process(self, instance):
+        if instance.data.get("farm"):
+            return
+
+        timing = instance.data.get("tvpaintExposureTiming")
+        if not timing:
+            self.log.debug("Skipping, exposure timing is not available.")
+            return
+
+        src_repre = next(
+            (
+                repre
+                for repre in instance.data.get("representations") or []
+                if repre["name"] == "png"
+                and "review" in (repre.get("tags") or [])
+            ),
+            None
+        )
+        if src_repre is None:
+            self.log.debug("Skipping, no PNG review representation.")
+            return
+
+        exposures = timing["exposures"]
+        frame_count = timing["frameEnd"] - timing["frameStart"] + 1
+        if len(exposures) == frame_count:
+            self.log.debug("Skipping, sequence does not have held frames.")
+            return
+
+        fps = timing.get("fps") or instance.context.data.get("sceneFps")
+        if not fps:
+            self.log.debug("Skipping, frame rate is not known.")
+            return
+        fps = float(fps)
+
+        staging_dir = src_repre["stagingDir"]
+        concat_path = os.path.join(staging_dir, "exposure_review.ffconcat")
+        self._write_concat_file(concat_path, exposures, fps)
+
+        output_filename = "exposure_review.mp4"
+        output_path = os.path.join(staging_dir, output_filename)
+        red, green, blue = timing["bgColor"]
+        # Background is drawn on a copy of each frame so timestamps of
+        #   frames are kept
+        video_filters = (
+            "split[src][fg];"
+            "[src]drawbox=c=0x{:02X}{:02X}{:02X}@1.0:replace=1:t=fill[bg];"
+            "[bg][fg]overlay=format=auto,"
+            "scale=trunc(iw/2)*2:trunc(ih/2)*2,"
+            "format=yuv420p"
+        ).format(red, green, blue)
+        args = get_ffmpeg_tool_args(
+            "ffmpeg",
+            "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", concat_path,
+            "-vf", video_filters,
+            "-vsync", "vfr",
+            "-c:v", "libx264",
+            "-crf", str(self.crf),
+            output_path,
+        )
+        self.log.debug(
+            "Encoding {} unique of {} frames.".format(
+                len(exposures), frame_count
+            )
+        )
+        run_subprocess(args, logger=self.log)
+        os.remove(concat_path)
+
+        instance.data["representations"].append({
+            "name": "mp4",
+            "ext": "mp4",
+            "files": output_filename,
+            "stagingDir": staging_dir,
+            "frameStart": timing["frameStart"],
+            "frameEnd": timing["frameEnd"],
+            "fps": fps,
+            "tags": list(self.output_tags),
+        })
+        # Review is created from video
+        src_repre["tags"] = [
+            tag
+            for tag in src_repre["tags"]
+            if tag != "review"
+        ]
+
+    def _write_concat_file(self, concat_path, exposures, fps):
+        lines = ["ffconcat version 1.0"]
+        for exposure in exposures:
+            lines.extend([
+                "file '{}'".format(exposure["file"]),
+                "duration {:.6f}".format(exposure["duration"] / fps),
+            ])
+        # Last file must be repeated to apply its duration
+        lines.append("file '{}'".format(exposures[-1]["file"]))
+        with open(concat_path, "w") as stream:
+            stream.write("\n".join(lines) + "\n")
@@ -2,13 +2,24 @@ from __future__ import annotations
 
 import os
 import copy
+import time
+import json
+import shutil
+import hashlib
 import tempfile
-from typing import Any
+import functools
+from typing import Any, Optional
 
 from PIL import Image
 
 import pyblish.api
 
+from ayon_core.lib import get_ffmpeg_tool_args
+try:
+    from ayon_core.lib import get_launcher_local_dir
+except ImportError:
+    # Older ayon-core versions
+    from ayon_core.lib import get_ayon_appdirs as get_launcher_local_dir
 from ayon_core.pipeline.publish import (
     KnownPublishError,
     get_publish_instance_families,
@@ -20,6 +31,21 @@ from ayon_tvpaint.api.lib import (
     get_layers_exposure_frames,
 )
 from ayon_tvpaint.lib import (
+    DEFAULT_IMAGE_CACHE_SIZE_MB,
+    DEFAULT_PREFIX_CACHE_SIZE_MB,
+    DEFAULT_FRAME_CACHE_SIZE_MB,
+    CompositeFrameCache,
+    DecodedImageCache,
+    ExtractionCheckpoint,
+    FilepathsByFrame,
+    BackgroundTaskQueue,
+    LayerRenderCache,
+    LayerExportStrategy,
+    LayerFrameStore,
+    ReviewVideoEncoder,
+    copy_render_file,
+    get_pixels_alpha_bbox,
+    get_file_hash,
     calculate_layers_extraction_data,
     get_frame_filename_template,
     fill_reference_frames,
@@ -28,6 +54,16 @@ from ayon_tvpaint.lib import (
 )
 
 
+# TVPaint save mode and extension of intermediate formats of layer frames
+INTERMEDIATE_FORMATS = {
+    "png": ("PNG", ".png"),
+    "tga": ("TGA", ".tga"),
+}
+# Names of intermediate files and directories created in staging directory
+#   - layer frames, layer frame stores and directories of range exports
+INTERMEDIATE_PATTERNS = ("pos_*", "layer_*.rgba", "range_*")
+
+
 class ExtractSequence(pyblish.api.InstancePlugin):
     label = "Extract Sequence"
     order = pyblish.api.ExtractorOrder
@@ -38,6 +74,21 @@ class ExtractSequence(pyblish.api.InstancePlugin):
 
     # Modifiable with settings
     review_bg = [255, 255, 255, 1.0]
+    image_cache_size = DEFAULT_IMAGE_CACHE_SIZE_MB
+    prefix_cache_size = DEFAULT_PREFIX_CACHE_SIZE_MB
+    # Worker processes are spawned from host process when higher than 1
+    composite_workers = 1
+    intermediate_format = "png"
+    use_frame_store = False
+    stripe_height = 0
+    background_post_process = False
+    post_process_queue_size = 2
+    adaptive_layer_export = False
+    range_export_min_density = 0.5
+    incremental_cache = False
+    incremental_cache_size = DEFAULT_FRAME_CACHE_SIZE_MB
+    resumable_extraction = False
+    stream_review = False
 
     def process(self, instance):
         if instance.data.get("farm"):
@@ -109,12 +160,22 @@ class ExtractSequence(pyblish.api.InstancePlugin):
 
         # Save to staging dir
         output_dir = instance.data.get("stagingDir")
+        is_own_staging_dir = False
         if not output_dir:
-            # Create temp folder if staging dir is not set
-            output_dir = (
-                tempfile.mkdtemp(prefix="tvpaint_render_")
-            ).replace("\\", "/")
+            output_dir = self._create_staging_dir(instance)
             instance.data["stagingDir"] = output_dir
+            is_own_staging_dir = True
+
+        # Staging dir set by other plugin may contain other files, files
+        #   of interrupted extraction are removed only in own directory
+        checkpoint = None
+        if (
+            self.resumable_extraction
+            and is_own_staging_dir
+            and instance.data["productType"] != "review"
+        ):
+            checkpoint = ExtractionCheckpoint(output_dir)
+            instance.data["tvpaintCheckpoint"] = checkpoint
 
         self.log.debug(
             "Files will be rendered to folder: {}".format(output_dir)
@@ -122,39 +183,174 @@ class ExtractSequence(pyblish.api.InstancePlugin):
 
         if instance.data["productType"] == "review":
             result = self.render_review(
-                output_dir, mark_in, mark_out, scene_bg_color
-            )
-        else:
-            # Render output
-            result = self.render(
                 output_dir,
                 mark_in,
                 mark_out,
-                filtered_layers,
-                ignore_layers_transparency
+                scene_bg_color,
+                output_frame_start,
             )
+            # Change scene frame Start back to previous value
+            execute_george("tv_startframe {}".format(scene_start_frame))
+            self._finish_instance(
+                instance,
+                result,
+                output_frame_start,
+                output_frame_end,
+                output_dir,
+            )
+            return
 
-        output_filepaths_by_frame_idx, thumbnail_fullpath = result
+        layer_render_cache = self._get_layer_render_cache(
+            instance.context
+        )
+        # Export layers from TVPaint
+        render_job = self.export_layers(
+            output_dir,
+            mark_in,
+            mark_out,
+            filtered_layers,
+            ignore_layers_transparency,
+            layer_render_cache,
+            self._get_scene_size(instance.context),
+            instance.context.data.get("layersData"),
+            scene_bg_color,
+            self._get_layer_export_strategy(instance.context),
+            output_frame_start,
+            checkpoint,
+            self._get_checkpoint_data(instance),
+        )
+        # Cached files are removed at the end of publishing
+        instance.context.data.setdefault(
+            "cleanupFullPaths", []
+        ).extend(layer_render_cache.pop_new_filepaths())
 
         # Change scene frame Start back to previous value
         execute_george("tv_startframe {}".format(scene_start_frame))
 
+        frame_cache = self._get_frame_cache(instance)
+        review_encoder = self._get_review_encoder(instance, output_dir)
+        if not self.background_post_process:
+            self._post_process(
+                instance,
+                render_job,
+                output_frame_start,
+                output_frame_end,
+                output_dir,
+                frame_cache,
+                review_encoder,
+            )
+            return
+
+        # Compositing runs in background while TVPaint exports next
+        #   instance. Background task does not touch instance data, result
+        #   is awaited and applied by 'ExtractSequenceFinish'
+        post_process_queue = self._get_post_process_queue(instance.context)
+        instance.data["tvpaintPostProcessFuture"] = (
+            post_process_queue.submit(
+                self._composite_instance,
+                render_job,
+                frame_cache,
+                review_encoder,
+            )
+        )
+        instance.data["tvpaintPostProcessFinish"] = functools.partial(
+            self._finish_post_process,
+            instance,
+            output_frame_start,
+            output_frame_end,
+            output_dir,
+            review_encoder,
+        )
+
+    def _post_process(
+        self,
+        instance,
+        render_job,
+        output_frame_start,
+        output_frame_end,
+        output_dir,
+        frame_cache=None,
+        review_encoder=None,
+    ):
+        self._finish_post_process(
+            instance,
+            output_frame_start,
+            output_frame_end,
+            output_dir,
+            review_encoder,
+            self._composite_instance(
+                render_job, frame_cache, review_encoder
+            ),
+        )
+
+    def _composite_instance(
+        self, render_job, frame_cache=None, review_encoder=None
+    ):
+        """Composite frames of instance without touching instance data.
+
+        Returns:
+            tuple[tuple, Optional[list]]: Result of 'composite_layers' and
+                exposures of output frames.
+        """
+        if render_job is None:
+            return ([], None), None
+        result = self.composite_layers(
+            render_job, frame_cache, review_encoder
+        )
+        return result, render_job.get("exposures")
+
+    def _finish_post_process(
+        self,
+        instance,
+        output_frame_start,
+        output_frame_end,
+        output_dir,
+        review_encoder,
+        composite_result,
+    ):
+        result, exposures = composite_result
+        self._finish_instance(
+            instance,
+            result,
+            output_frame_start,
+            output_frame_end,
+            output_dir,
+            review_encoder,
+            exposures,
+        )
+
+    def _finish_instance(
+        self,
+        instance,
+        result,
+        output_frame_start,
+        output_frame_end,
+        output_dir,
+        review_encoder=None,
+        exposures=None,
+    ):
+        output_filepaths_by_frame_idx, thumbnail_fullpath = result
+
         # Sequence of one frame
         if not output_filepaths_by_frame_idx:
             self.log.warning("Extractor did not create any output.")
             return
 
-        repre_files = self._rename_output_files(
-            output_filepaths_by_frame_idx,
-            mark_in,
-            mark_out,
-            output_frame_start
+        # Files are already named by output frames
+        repre_files = [
+            os.path.basename(output_filepaths_by_frame_idx[frame_idx])
+            for frame_idx in sorted(output_filepaths_by_frame_idx)
+        ]
+
+        # Review was encoded during compositing
+        has_review_video = (
+            review_encoder is not None and review_encoder.frame_count > 0
         )
 
         # Fill tags and new families from project settings
         instance_families = get_publish_instance_families(instance)
         tags = []
-        if "review" in instance_families:
+        if "review" in instance_families and not has_review_video:
             tags.append("review")
 
         # Sequence of one frame
@@ -180,6 +376,27 @@ class ExtractSequence(pyblish.api.InstancePlugin):
 
         instance.data["representations"].append(new_repre)
 
+        if "review" in tags and not single_file and exposures:
+            self._store_exposure_timing(
+                instance, repre_files, output_frame_start, exposures
+            )
+
+        if has_review_video:
+            review_repre = {
+                "name": "mp4",
+                "ext": "mp4",
+                "files": os.path.basename(review_encoder.output_path),
+                "stagingDir": output_dir,
+                "frameStart": output_frame_start,
+                "frameEnd": output_frame_end,
+                "fps": self._get_fps(instance),
+                "tags": ["review", "delete"],
+            }
+            self.log.debug(
+                "Creating review representation: {}".format(review_repre)
+            )
+            instance.data["representations"].append(review_repre)
+
         if not thumbnail_fullpath:
             return
 
@@ -197,37 +414,67 @@ class ExtractSequence(pyblish.api.InstancePlugin):
         }
         instance.data["representations"].append(thumbnail_repre)
 
-    def _rename_output_files(
-        self, filepaths_by_frame, mark_in, mark_out, output_frame_start
+    def _store_exposure_timing(
+        self, instance, filenames, output_frame_start, exposures
     ):
-        new_filepaths_by_frame = rename_filepaths_by_frame_start(
-            filepaths_by_frame, mark_in, mark_out, output_frame_start
-        )
+        """Store exposure timing of output sequence to instance data.
 
-        repre_filenames = []
-        for filepath in new_filepaths_by_frame.values():
-            repre_filenames.append(os.path.basename(filepath))
+        Timing contains only unique frames with their durations, so
+        review can be encoded without duplicated frames. Unique frames are
+        known from compositing and output files don't have to be compared.
 
-        if mark_in < output_frame_start:
-            repre_filenames = list(reversed(repre_filenames))
-
-        return repre_filenames
+        Args:
+            instance (pyblish.api.Instance): Processed instance.
+            filenames (list[str]): Filenames of output sequence in order.
+            output_frame_start (int): First output frame.
+            exposures (list[tuple[int, int]]): First frame index in scene
+                and duration of each exposure.
+        """
+        first_frame_idx = exposures[0][0]
+        timing = {
+            "fps": self._get_fps(instance),
+            "frameStart": output_frame_start,
+            "frameEnd": output_frame_start + len(filenames) - 1,
+            "bgColor": list(self._get_review_bg_color()),
+            "exposures": [
+                {
+                    "file": filenames[frame_idx - first_frame_idx],
+                    "frame": output_frame_start + frame_idx - first_frame_idx,
+                    "duration": duration,
+                }
+                for frame_idx, duration in exposures
+            ],
+        }
+        self.log.debug("Exposure timing has {} unique of {} frames.".format(
+            len(exposures), len(filenames)
+        ))
+        instance.data["tvpaintExposureTiming"] = timing
 
     def render_review(
-        self, output_dir, mark_in, mark_out, scene_bg_color
+        self,
+        output_dir,
+        mark_in,
+        mark_out,
+        scene_bg_color,
+        output_frame_start=None,
     ):
         """ Export images from TVPaint using `tv_savesequence` command.
 
+        Files are renamed to output frames after export because TVPaint
+        names files by frame index in scene.
+
         Args:
             output_dir (str): Directory where files will be stored.
             mark_in (int): Starting frame index from which export will begin.
             mark_out (int): On which frame index export will end.
             scene_bg_color (list): Bg color set in scene. Result of george
                 script command `tv_background`.
+            output_frame_start (Optional[int]): First output frame. Mark In
+                is used if not passed.
 
         Returns:
-            tuple: With 2 items first is list of filenames second is path to
-                thumbnail.
+            tuple: With 2 items first is filepaths by output frame second is
+                path to thumbnail.
         """
         filename_template = get_frame_filename_template(mark_out)
 
@@ -250,17 +497,10 @@ class ExtractSequence(pyblish.api.InstancePlugin):
                 mark_in, mark_out
             )
         ]
-        if scene_bg_color:
-            # Change bg color back to previous scene bg color
-            _scene_bg_color = copy.deepcopy(scene_bg_color)
-            bg_type = _scene_bg_color.pop(0)
-            orig_color_command = [
-                "tv_background",
-                "\"{}\"".format(bg_type)
-            ]
-            orig_color_command.extend(_scene_bg_color)
-
-            george_script_lines.append(" ".join(orig_color_command))
+        # Change bg color back to previous scene bg color
+        bg_color_line = self._get_scene_bg_color_line(scene_bg_color)
+        if bg_color_line:
+            george_script_lines.append(bg_color_line)
 
         execute_george_through_file("\n".join(george_script_lines))
 
@@ -290,10 +530,29 @@ class ExtractSequence(pyblish.api.InstancePlugin):
                 source_img = source_img.convert("RGB")
             source_img.save(thumbnail_filepath)
 
+        if (
+            output_frame_start is not None
+            and output_frame_start != mark_in
+        ):
+            output_filepaths_by_frame_idx = rename_filepaths_by_frame_start(
+                output_filepaths_by_frame_idx,
+                mark_in,
+                mark_out,
+                output_frame_start
+            )
+
         return output_filepaths_by_frame_idx, thumbnail_filepath
 
     def render(
-        self, output_dir, mark_in, mark_out, layers, ignore_layer_opacity
+        self,
+        output_dir,
+        mark_in,
+        mark_out,
+        layers,
+        ignore_layer_opacity,
+        layer_render_cache=None,
+        transparent_size=None,
+        output_frame_start=None,
     ):
         """ Export images from TVPaint.
 
@@ -303,10 +562,81 @@ class ExtractSequence(pyblish.api.InstancePlugin):
             mark_out (int): On which frame index export will end.
             layers (list): List of layers to be exported.
             ignore_layer_opacity (bool): Layer's opacity will be ignored.
+            layer_render_cache (Optional[LayerRenderCache]): Cache of layer
+                frames exported during current publishing.
+            transparent_size (Optional[tuple[int, int]]): Size of output
+                images used when all layer frames are fully transparent.
+            output_frame_start (Optional[int]): First output frame used in
+                filenames. Mark In is used if not passed.
 
         Returns:
-            tuple: With 2 items first is list of filenames second is path to
-                thumbnail.
+            tuple: With 2 items first is filepaths by output frame second is
+                path to thumbnail.
+        """
+        render_job = self.export_layers(
+            output_dir,
+            mark_in,
+            mark_out,
+            layers,
+            ignore_layer_opacity,
+            layer_render_cache,
+            transparent_size,
+            output_frame_start=output_frame_start,
+        )
+        if render_job is None:
+            return [], None
+        return self.composite_layers(render_job)
+
+    def export_layers(
+        self,
+        output_dir,
+        mark_in,
+        mark_out,
+        layers,
+        ignore_layer_opacity,
+        layer_render_cache=None,
+        transparent_size=None,
+        scene_layers=None,
+        scene_bg_color=None,
+        export_strategy=None,
+        output_frame_start=None,
+        checkpoint=None,
+        checkpoint_data=None,
+    ):
+        """Export layer frames from TVPaint.
+
+        Only part of rendering which requires TVPaint. Result is used in
+        'composite_layers' which can run while TVPaint exports other
+        instance.
+
+        Args:
+            output_dir (str): Directory where files will be stored.
+            mark_in (int): Starting frame index from which export will begin.
+            mark_out (int): On which frame index export will end.
+            layers (list): List of layers to be exported.
+            ignore_layer_opacity (bool): Layer's opacity will be ignored.
+            layer_render_cache (Optional[LayerRenderCache]): Cache of layer
+                frames exported during current publishing.
+            transparent_size (Optional[tuple[int, int]]): Size of output
+                images used when all layer frames are fully transparent.
+            scene_layers (Optional[list[dict[str, Any]]]): All layers of
+                scene, visible layers are hidden during range export.
+            scene_bg_color (Optional[list]): Bg color set in scene. Result
+                of george script command `tv_background`.
+            export_strategy (Optional[LayerExportStrategy]): Strategy
+                choosing between exposures and range export of layers.
+                Exposures are always exported one by one if not passed.
+            output_frame_start (Optional[int]): First output frame used in
+                filenames. Mark In is used if not passed.
+            checkpoint (Optional[ExtractionCheckpoint]): Checkpoint of
+                previous extraction to the output directory. Frames which
+                were already composited are not exported again.
+            checkpoint_data (Optional[dict[str, Any]]): Additional data
+                used for signature of checkpoint.
+
+        Returns:
+            Union[dict[str, Any], None]: Data for compositing or 'None' if
+                there is nothing to render.
         """
         self.log.debug("Preparing data for rendering.")
 
@@ -325,43 +655,237 @@ class ExtractSequence(pyblish.api.InstancePlugin):
         # Sort layer positions in reverse order
         sorted_positions = list(reversed(sorted(layers_by_position.keys())))
         if not sorted_positions:
-            return [], None
+            return None
+
+        # Layer frames are only intermediates for compositing
+        save_mode, intermediate_ext = self._get_intermediate_format()
 
         self.log.debug("Collecting pre/post behavior of individual layers.")
         behavior_by_layer_id = get_layers_pre_post_behavior(layer_ids)
         exposure_frames_by_layer_id = get_layers_exposure_frames(
             layer_ids, layers
         )
+        # Files are named by output frames so they don't have to be renamed
+        frame_offset = 0
+        if output_frame_start is not None:
+            frame_offset = output_frame_start - mark_in
+
         extraction_data_by_layer_id = calculate_layers_extraction_data(
             layers,
             exposure_frames_by_layer_id,
             behavior_by_layer_id,
             mark_in,
-            mark_out
+            mark_out,
+            ext=intermediate_ext,
+            frame_offset=frame_offset,
         )
+        # Density is applied during compositing, range export resets it on
+        #   its own so it's not needed when opacity is ignored
+        if not ignore_layer_opacity:
+            self._collect_layers_density(
+                extraction_data_by_layer_id.keys(), layers_by_id
+            )
 
-        # Render layers
-        filepaths_by_layer_id = {}
+        skip_frames = set()
+        if checkpoint is not None:
+            signature = self._get_checkpoint_signature(
+                layers,
+                exposure_frames_by_layer_id,
+                behavior_by_layer_id,
+                mark_in,
+                mark_out,
+                frame_offset,
+                ignore_layer_opacity,
+                checkpoint_data,
+            )
+            if not checkpoint.validate(signature):
+                self.log.debug("Checkpoint does not match, extracting all.")
+            checkpoint.start_stage("sequence")
+            skip_frames = self._get_checkpoint_frames(
+                checkpoint, mark_in, mark_out, frame_offset
+            )
+            # Only finished output frames are kept, intermediate files of
+            #   interrupted extraction are exported again
+            output_template = self._get_output_filename_template(
+                mark_out, frame_offset
+            )
+            checkpoint.remove_unrecorded_files(
+                filenames=[
+                    output_template.format(frame=frame_idx + frame_offset)
+                    for frame_idx in range(mark_in, mark_out + 1)
+                ],
+                patterns=INTERMEDIATE_PATTERNS,
+            )
+            if skip_frames:
+                self.log.info(
+                    "Resuming extraction, {} frames are already done."
+                    .format(len(skip_frames))
+                )
+                self._skip_finished_frames(
+                    extraction_data_by_layer_id,
+                    skip_frames,
+                    mark_in,
+                    mark_out,
+                )
+
+        # Prepare export of all layers so TVPaint can export them in
+        #   single George script
+        george_script_lines = [f"tv_SaveMode \"{save_mode}\""]
+        layer_exports = []
+        range_exports = []
+        exposure_count = 0
         for layer_id, render_data in extraction_data_by_layer_id.items():
             layer = layers_by_id[layer_id]
-            transparency = 1.0
+            layer_export = self._prepare_layer_export(
+                render_data,
+                layer,
+                output_dir,
+                intermediate_ext,
+                layer_render_cache,
+            )
+            layer_exports.append(layer_export)
+            render_filepaths = layer_export["render_filepaths"]
+            if export_strategy is not None and render_filepaths:
+                range_start = min(render_filepaths)
+                range_end = max(render_filepaths)
+                strategy = export_strategy.choose(
+                    len(render_filepaths), range_end - range_start + 1
+                )
+                if strategy == LayerExportStrategy.RANGE:
+                    self.log.debug(
+                        "Exporting range {}-{} of layer {} ({})".format(
+                            range_start, range_end, layer_id, layer["name"]
+                        )
+                    )
+                    range_exports.append(layer_export)
+                    continue
+
+            layer_george_lines = layer_export["george_script_lines"]
+            if layer_george_lines:
+                exposure_count += len(render_filepaths)
+                george_script_lines.append(f"tv_layerset {layer_id}")
+                george_script_lines.extend(layer_george_lines)
+
+        # Let TVPaint render images of all layers
+        if len(george_script_lines) > 1:
+            self.log.debug("Exporting layer images.")
+            start_time = time.perf_counter()
+            execute_george_through_file("\n".join(george_script_lines))
+            if export_strategy is not None:
+                export_strategy.record_exposures(
+                    exposure_count, time.perf_counter() - start_time
+                )
+
+        if range_exports:
+            self._export_layer_ranges(
+                range_exports,
+                output_dir,
+                save_mode,
+                intermediate_ext,
+                scene_layers or layers,
+                scene_bg_color,
+                export_strategy,
+            )
+
+        opacity_by_layer_id = {}
+        for layer_export in layer_exports:
+            layer_id = layer_export["layer_id"]
+            # Exported frames are available for other instances right away
+            for frame_idx, export_path in (
+                layer_export["export_filepaths"].items()
+            ):
+                layer_render_cache.add(layer_id, frame_idx, export_path)
+
             if not ignore_layer_opacity:
-                # The only way how to get current transparency is to set new
-                #   value which returns previous value.
-                transparency_int = int(execute_george("tv_layerdensity 100"))
-                execute_george(f"tv_layerdensity {transparency_int}")
-                transparency = float(transparency_int) / 100.0
+                # Density is applied during compositing
+                opacity = layers_by_id[layer_id].get("opacity")
+                if opacity is not None:
+                    opacity_by_layer_id[layer_id] = float(opacity) / 100.0
+
+        return {
+            "output_dir": output_dir,
+            "mark_in": mark_in,
+            "mark_out": mark_out,
+            "frame_offset": frame_offset,
+            "layers": layers,
+            "layer_exports": layer_exports,
+            "opacity_by_layer_id": opacity_by_layer_id,
+            "layer_render_cache": layer_render_cache,
+            "transparent_size": transparent_size,
+            "checkpoint": checkpoint,
+            "skip_frames": skip_frames,
+        }
+
+    def composite_layers(
+        self, render_job, frame_cache=None, review_encoder=None
+    ):
+        """Composite exported layer frames to output frames.
+
+        Does not communicate with TVPaint.
+
+        Args:
+            render_job (dict[str, Any]): Data from 'export_layers'.
+            frame_cache (Optional[CompositeFrameCache]): Cache of frames
+                composited by previous publishes of the instance.
+            review_encoder (Optional[ReviewVideoEncoder]): Encoder of
+                review video receiving composited frames.
 
-            filepaths_by_layer_id[layer_id] = self._render_layer(
-                render_data, layer, output_dir, transparency
+        Returns:
+            tuple: With 2 items first is filepaths by output frame second is
+                path to thumbnail.
+        """
+        output_dir = render_job["output_dir"]
+        mark_in = render_job["mark_in"]
+        mark_out = render_job["mark_out"]
+        frame_offset = render_job["frame_offset"]
+        layer_exports = render_job["layer_exports"]
+
+        # Hash sources before they're moved to frame store
+        content_hashes_by_layer_id = None
+        if frame_cache is not None:
+            content_hashes_by_layer_id = self._get_content_hashes(
+                layer_exports, render_job["layer_render_cache"]
+            )
+            exposure_hashes = {
+                f"{layer_id}:{frame_idx}": content_hash
+                for layer_id, content_hashes in (
+                    content_hashes_by_layer_id.items()
+                )
+                for frame_idx, content_hash in content_hashes.items()
+            }
+            changed_count = frame_cache.update_exposures(exposure_hashes)
+            self.log.debug(
+                "Exposures changed since last publish: {}/{}".format(
+                    changed_count, len(exposure_hashes)
+                )
+            )
+
+        # Exposures decoded to find visible pixels are kept for compositing
+        #   when it runs in this process
+        image_cache_size = 0
+        if self.composite_workers == 1 or review_encoder is not None:
+            image_cache_size = self.image_cache_size
+        image_cache = DecodedImageCache(image_cache_size)
+
+        filepaths_by_layer_id = {}
+        for layer_export in layer_exports:
+            filepaths_by_layer_id[layer_export["layer_id"]] = (
+                self._finish_layer_export(
+                    layer_export,
+                    output_dir,
+                    image_cache,
+                    render_job["layer_render_cache"],
+                )
             )
 
         # Prepare final filepaths where compositing should store result
         output_filepaths_by_frame = {}
         thumbnail_src_filepath = None
-        finale_template = get_frame_filename_template(mark_out)
+        finale_template = self._get_output_filename_template(
+            mark_out, frame_offset
+        )
         for frame_idx in range(mark_in, mark_out + 1):
-            filename = finale_template.format(frame=frame_idx)
+            filename = finale_template.format(frame=frame_idx + frame_offset)
 
             filepath = os.path.join(output_dir, filename)
             output_filepaths_by_frame[frame_idx] = filepath
@@ -369,14 +893,62 @@ class ExtractSequence(pyblish.api.InstancePlugin):
             if thumbnail_src_filepath is None:
                 thumbnail_src_filepath = filepath
 
+        # Record finished batches of frames to be able to resume
+        checkpoint = render_job["checkpoint"]
+        on_frames_done = None
+        if checkpoint is not None:
+            def on_frames_done(filepaths):
+                checkpoint.add_files("sequence", filepaths)
+
         self.log.info("Started compositing of layer frames.")
-        composite_rendered_layers(
-            layers,
-            filepaths_by_layer_id,
-            mark_in,
-            mark_out,
-            output_filepaths_by_frame,
-        )
+        try:
+            # Exposures are used to encode review only from unique frames
+            render_job["exposures"] = composite_rendered_layers(
+                render_job["layers"],
+                filepaths_by_layer_id,
+                mark_in,
+                mark_out,
+                output_filepaths_by_frame,
+                frame_references_by_layer_id={
+                    layer_id: filepaths_by_frame.frame_references
+                    for layer_id, filepaths_by_frame in (
+                        filepaths_by_layer_id.items()
+                    )
+                },
+                image_cache_size_mb=self.image_cache_size,
+                prefix_cache_size_mb=self.prefix_cache_size,
+                max_workers=self.composite_workers,
+                opacity_by_layer_id=render_job["opacity_by_layer_id"],
+                transparent_size=render_job["transparent_size"],
+                alpha_bboxes_by_layer_id={
+                    layer_export["layer_id"]: layer_export["alpha_bboxes"]
+                    for layer_export in layer_exports
+                },
+                stripe_height=self.stripe_height,
+                frame_cache=frame_cache,
+                content_hashes_by_layer_id=content_hashes_by_layer_id,
+                skip_frames=render_job["skip_frames"],
+                on_frames_done=on_frames_done,
+                review_encoder=review_encoder,
+                image_cache=image_cache,
+            )
+        except Exception:
+            if review_encoder is not None:
+                review_encoder.abort()
+            raise
+        finally:
+            image_cache.clear()
+        if review_encoder is not None:
+            review_encoder.close()
+        if checkpoint is not None:
+            checkpoint.finish_stage("sequence")
+        if frame_cache is not None:
+            self.log.info(
+                "Reused {} frames from previous publish.".format(
+                    frame_cache.reused_count
+                )
+            )
+            frame_cache.save()
 
         self.log.info("Compositing finished")
         thumbnail_filepath = None
@@ -401,7 +973,197 @@ class ExtractSequence(pyblish.api.InstancePlugin):
                 ).format(source_img.mode))
                 source_img.save(thumbnail_filepath)
 
-        return output_filepaths_by_frame, thumbnail_filepath
+        output_filepaths_by_output_frame = {
+            frame_idx + frame_offset: filepath
+            for frame_idx, filepath in output_filepaths_by_frame.items()
+        }
+        return output_filepaths_by_output_frame, thumbnail_filepath
+
+    def _collect_layers_density(self, layer_ids, layers_by_id):
+        """Collect density of rendered layers and store it as 'opacity'.
+
+        The only way how to get layer density is to set new value which
+        returns previous value, so the previous value is set back. That
+        changes current layer, so density is collected only for layers that
+        are rendered and the current layer is restored.
+
+        Args:
+            layer_ids (Iterable[int]): Ids of rendered layers.
+            layers_by_id (dict[int, dict[str, Any]]): Layers data by id.
+        """
+        layer_ids = list(layer_ids)
+        if not layer_ids:
+            return
+
+        output_filepath = self._create_tmp_filepath()
+        george_script_lines = [
+            f"output_path = \"{output_filepath}\"",
+            "tv_LayerCurrentID",
+            "current_layer_id = result",
+        ]
+        for layer_id in layer_ids:
+            george_script_lines.extend([
+                f"tv_layerset {layer_id}",
+                "tv_layerdensity 100",
+                "density = result",
+                "tv_layerdensity density",
+                f"line = \"{layer_id}|\"density",
+                (
+                    "tv_writetextfile \"strict\" \"append\""
+                    " '\"'output_path'\"' line"
+                ),
+            ])
+        george_script_lines.extend([
+            "IF CMP(current_layer_id, \"NONE\")==0",
+            "tv_layerset current_layer_id",
+            "END",
+        ])
+        execute_george_through_file("\n".join(george_script_lines))
+
+        with open(output_filepath, "r") as stream:
+            content = stream.read()
+        os.remove(output_filepath)
+
+        for line in content.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            layer_id, _, density = line.partition("|")
+            layers_by_id[int(layer_id)]["opacity"] = int(density)
+
+    def _create_tmp_filepath(self):
+        tmp_file = tempfile.NamedTemporaryFile(
+            mode="w", prefix="a_tvp_", suffix=".txt", delete=False
+        )
+        tmp_file.close()
+        return tmp_file.name.replace("\\", "/")
+
+    def _export_layer_ranges(
+        self,
+        range_exports,
+        output_dir,
+        save_mode,
+        ext,
+        scene_layers,
+        scene_bg_color,
+        export_strategy,
+    ):
+        """Export ranges of layers with 'tv_savesequence'.
+
+        Only the exported layer is visible, scene background is disabled
+        and layer density is set to 100 during the export, as density is
+        applied during compositing. Frames which are not exposures are
+        removed after export. Current layer is restored.
+        """
+        visible_layer_ids = [
+            layer["layer_id"]
+            for layer in scene_layers
+            if layer["visible"]
+        ]
+        george_script_lines = [
+            f"tv_SaveMode \"{save_mode}\"",
+            "tv_background \"none\"",
+            "tv_LayerCurrentID",
+            "current_layer_id = result",
+        ]
+        for layer_id in visible_layer_ids:
+            george_script_lines.append(f"tv_layerdisplay {layer_id} \"off\"")
+
+        frame_count = 0
+        range_outputs = []
+        for layer_export in range_exports:
+            layer_id = layer_export["layer_id"]
+            render_filepaths = layer_export["render_filepaths"]
+            range_start = min(render_filepaths)
+            range_end = max(render_filepaths)
+            frame_count += range_end - range_start + 1
+            range_dir = tempfile.mkdtemp(
+                prefix=f"range_{layer_id}_", dir=output_dir
+            ).replace("\\", "/")
+            filename_template = get_frame_filename_template(
+                range_end, "range.", ext
+            )
+            range_outputs.append(
+                (layer_export, range_dir, filename_template)
+            )
+            first_frame_filepath = "/".join([
+                range_dir, filename_template.format(frame=range_start)
+            ])
+            # Setting density returns previous value which is set back
+            george_script_lines.extend([
+                f"tv_layerdisplay {layer_id} \"on\"",
+                f"tv_layerset {layer_id}",
+                "tv_layerdensity 100",
+                "density = result",
+                f"export_path = \"{first_frame_filepath}\"",
+                "tv_savesequence '\"'export_path'\"' {} {}".format(
+                    range_start, range_end
+                ),
+                "tv_layerdensity density",
+                f"tv_layerdisplay {layer_id} \"off\"",
+            ])
+
+        # Restore visibility of layers and scene background
+        for layer_id in visible_layer_ids:
+            george_script_lines.append(f"tv_layerdisplay {layer_id} \"on\"")
+        bg_color_line = self._get_scene_bg_color_line(scene_bg_color)
+        if bg_color_line:
+            george_script_lines.append(bg_color_line)
+        george_script_lines.extend([
+            "IF CMP(current_layer_id, \"NONE\")==0",
+            "tv_layerset current_layer_id",
+            "END",
+        ])
+
+        start_time = time.perf_counter()
+        execute_george_through_file("\n".join(george_script_lines))
+        if export_strategy is not None:
+            export_strategy.record_range(
+                len(range_exports),
+                frame_count,
+                time.perf_counter() - start_time
+            )
+
+        # Keep only exposure frames
+        for layer_export, range_dir, filename_template in range_outputs:
+            for frame_idx, dst_path in (
+                layer_export["render_filepaths"].items()
+            ):
+                src_path = "/".join([
+                    range_dir, filename_template.format(frame=frame_idx)
+                ])
+                if not os.path.exists(src_path):
+                    raise KnownPublishError(
+                        "Output was not rendered. File was not found {}"
+                        .format(src_path)
+                    )
+                os.replace(src_path, dst_path)
+            shutil.rmtree(range_dir)
+
+    def _get_scene_bg_color_line(self, scene_bg_color):
+        """George line setting back scene background color."""
+        if not scene_bg_color:
+            return None
+        _scene_bg_color = copy.deepcopy(scene_bg_color)
+        bg_type = _scene_bg_color.pop(0)
+        orig_color_command = [
+            "tv_background",
+            "\"{}\"".format(bg_type)
+        ]
+        orig_color_command.extend(_scene_bg_color)
+        return " ".join(orig_color_command)
+
+    def _get_layer_export_strategy(self, context):
+        if not self.adaptive_layer_export:
+            return None
+        # Measured durations are shared across instances of publishing
+        export_strategy = context.data.get("tvpaintLayerExportStrategy")
+        if export_strategy is None:
+            export_strategy = LayerExportStrategy(
+                self.range_export_min_density
+            )
+            context.data["tvpaintLayerExportStrategy"] = export_strategy
+        return export_strategy
 
     def _get_review_bg_color(self):
         red = green = blue = 255
@@ -412,60 +1174,465 @@ class ExtractSequence(pyblish.api.InstancePlugin):
                 red, green, blue = self.review_bg
         return (red, green, blue)
 
-    def _render_layer(
+    def _get_post_process_queue(self, context) -> BackgroundTaskQueue:
+        """Queue running compositing of instances in background."""
+        post_process_queue = context.data.get("tvpaintPostProcessQueue")
+        if post_process_queue is None:
+            post_process_queue = BackgroundTaskQueue(
+                self.post_process_queue_size
+            )
+            context.data["tvpaintPostProcessQueue"] = post_process_queue
+        return post_process_queue
+
+    def _get_scene_size(self, context):
+        width = context.data.get("sceneWidth")
+        height = context.data.get("sceneHeight")
+        if width and height:
+            return int(width), int(height)
+        return None
+
+    def _get_intermediate_format(self):
+        """TVPaint save mode and extension used for layer frames."""
+        intermediate_format = INTERMEDIATE_FORMATS.get(
+            (self.intermediate_format or "").lower()
+        )
+        if intermediate_format is None:
+            self.log.warning((
+                "Unknown intermediate format \"{}\". Using PNG."
+            ).format(self.intermediate_format))
+            intermediate_format = INTERMEDIATE_FORMATS["png"]
+        return intermediate_format
+
+    def _get_output_filename_template(self, mark_out, frame_offset):
+        return get_frame_filename_template(
+            max(mark_out, mark_out + frame_offset)
+        )
+
+    def _create_staging_dir(self, instance) -> str:
+        """Create staging dir when it's not set on instance.
+
+        Resumable extraction uses the same directory for the same instance,
+        so next publish can continue in previous output.
+        """
+        cache_name = None
+        # Review is not resumable
+        if (
+            self.resumable_extraction
+            and instance.data["productType"] != "review"
+        ):
+            cache_name = self._get_instance_cache_name(instance)
+        if not cache_name:
+            return (
+                tempfile.mkdtemp(prefix="tvpaint_render_")
+            ).replace("\\", "/")
+
+        output_dir = os.path.join(
+            tempfile.gettempdir(), f"tvpaint_render_{cache_name[:16]}"
+        ).replace("\\", "/")
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    def _get_checkpoint_data(self, instance) -> dict[str, Any]:
+        """Data of workfile used in checkpoint signature.
+
+        Modification time makes sure that workfile saved with changes after
+        failed publish is extracted again.
+        """
+        workfile_path = instance.context.data.get("currentFile")
+        workfile_mtime = None
+        if workfile_path and os.path.exists(workfile_path):
+            workfile_mtime = os.path.getmtime(workfile_path)
+        return {
+            "workfile": workfile_path,
+            "workfile_mtime": workfile_mtime,
+            "intermediate_format": self.intermediate_format,
+        }
+
+    def _get_checkpoint_signature(
+        self,
+        layers,
+        exposure_frames_by_layer_id,
+        behavior_by_layer_id,
+        mark_in,
+        mark_out,
+        frame_offset,
+        ignore_layer_opacity,
+        checkpoint_data,
+    ) -> str:
+        layers_data = [
+            [
+                layer["layer_id"],
+                layer["position"],
+                layer["visible"],
+                layer["frame_start"],
+                layer["frame_end"],
+                layer.get("opacity"),
+                exposure_frames_by_layer_id.get(str(layer["layer_id"])),
+                behavior_by_layer_id.get(str(layer["layer_id"])),
+            ]
+            for layer in sorted(layers, key=lambda item: item["position"])
+        ]
+        signature_data = {
+            "mark_in": mark_in,
+            "mark_out": mark_out,
+            "frame_offset": frame_offset,
+            "ignore_layer_opacity": ignore_layer_opacity,
+            "layers": layers_data,
+            "data": checkpoint_data,
+        }
+        return hashlib.sha1(
+            json.dumps(signature_data, sort_keys=True, default=str)
+            .encode("utf-8")
+        ).hexdigest()
+
+    def _get_checkpoint_frames(
+        self, checkpoint, mark_in, mark_out, frame_offset
+    ) -> set[int]:
+        """Frames which were already composited and verified."""
+        verified_filenames = checkpoint.get_verified_files("sequence")
+        if not verified_filenames:
+            return set()
+        template = self._get_output_filename_template(
+            mark_out, frame_offset
+        )
+        return {
+            frame_idx
+            for frame_idx in range(mark_in, mark_out + 1)
+            if template.format(frame=frame_idx + frame_offset)
+            in verified_filenames
+        }
+
+    def _skip_finished_frames(
+        self, extraction_data_by_layer_id, skip_frames, mark_in, mark_out
+    ):
+        """Don't export layer frames used only by finished frames."""
+        for render_data in extraction_data_by_layer_id.values():
+            frame_references = render_data["frame_references"]
+            # Layer does not have to cover all frames in range
+            needed_references = {
+                frame_references.get(frame_idx)
+                for frame_idx in range(mark_in, mark_out + 1)
+                if frame_idx not in skip_frames
+            }
+            unneeded_references = (
+                frame_references.get_frames_to_render() - needed_references
+            )
+            if unneeded_references:
+                render_data["frame_references"] = (
+                    frame_references.without_references(unneeded_references)
+                )
+
+    def _get_fps(self, instance):
+        fps = instance.data.get("fps")
+        if fps is None:
+            fps = instance.context.data.get("sceneFps")
+        return fps
+
+    def _get_review_encoder(
+        self, instance, output_dir
+    ) -> Optional[ReviewVideoEncoder]:
+        """Encoder of review video streamed from compositing."""
+        if not self.stream_review:
+            return None
+        if "review" not in get_publish_instance_families(instance):
+            return None
+        fps = self._get_fps(instance)
+        if fps is None:
+            self.log.info(
+                "Frame rate is not known, review is not streamed."
+            )
+            return None
+        return ReviewVideoEncoder(
+            get_ffmpeg_tool_args("ffmpeg"),
+            os.path.join(output_dir, "review_stream.mp4"),
+            fps,
+            self._get_review_bg_color(),
+        )
+
+    def _get_frame_cache(self, instance) -> Optional[CompositeFrameCache]:
+        """Cache of composited frames kept between publishes.
+
+        Cache is stored in local directory per instance.
+        """
+        if not self.incremental_cache:
+            return None
+        cache_name = self._get_instance_cache_name(instance)
+        if not cache_name:
+            return None
+        return CompositeFrameCache(
+            get_launcher_local_dir("addons", "tvpaint", "frame_cache"),
+            cache_name,
+            self.incremental_cache_size,
+        )
+
+    def _get_instance_cache_name(self, instance) -> Optional[str]:
+        """Name identifying instance between publishes.
+
+        Workfile path is not used because publishing saves new version of
+        workfile, so the name is created from context and instance id.
+
+        Returns:
+            Optional[str]: Name or None if instance does not have id.
+        """
+        instance_id = instance.data.get("instance_id")
+        if not instance_id:
+            return None
+        context = instance.context
+        parts = (
+            context.data.get("projectName"),
+            instance.data.get("folderPath") or context.data.get("folderPath"),
+            instance.data.get("task") or context.data.get("task"),
+            instance.data.get("productName"),
+            instance_id,
+        )
+        return hashlib.sha1(
+            "|".join(str(part) for part in parts).encode("utf-8")
+        ).hexdigest()
+
+    def _get_content_hashes(
+        self,
+        layer_exports: list[dict[str, Any]],
+        layer_render_cache: Optional[LayerRenderCache],
+    ) -> dict[int, dict[int, str]]:
+        """Content hashes of exported layer frames by frame per layer id."""
+        content_hashes_by_layer_id = {}
+        for layer_export in layer_exports:
+            layer_id = layer_export["layer_id"]
+            content_hashes = {}
+            for frame_idx, src_path in (
+                layer_export["source_filepaths"].items()
+            ):
+                if layer_render_cache is not None:
+                    content_hash = layer_render_cache.get_content_hash(
+                        layer_id, frame_idx, src_path
+                    )
+                else:
+                    content_hash = get_file_hash(src_path)
+                content_hashes[frame_idx] = content_hash
+            content_hashes_by_layer_id[layer_id] = content_hashes
+        return content_hashes_by_layer_id
+
+    def _get_layer_render_cache(self, context) -> LayerRenderCache:
+        """Cache of layer frames shared across instances of publishing."""
+        layer_render_cache = context.data.get("tvpaintLayerRenderCache")
+        if layer_render_cache is None:
+            cache_dir = tempfile.mkdtemp(prefix="tvpaint_layer_cache_")
+            layer_render_cache = LayerRenderCache(cache_dir)
+            context.data["tvpaintLayerRenderCache"] = layer_render_cache
+            context.data.setdefault("cleanupEmptyDirs", []).append(
+                cache_dir
+            )
+        return layer_render_cache
+
+    def _prepare_layer_export(
         self,
         render_data: dict[str, Any],
         layer: dict[str, Any],
         output_dir: str,
-        transparency: float,
-    ):
+        ext: str,
+        layer_render_cache: Optional[LayerRenderCache] = None,
+    ) -> dict[str, Any]:
+        """Prepare George script lines exporting exposure frames of layer.
+
+        Frames already exported by other instance are used from cache
+        and are not part of the script.
+
+        Returns:
+            dict[str, Any]: Data needed to finish the export after the
+                George script was executed.
+        """
         frame_references = render_data["frame_references"]
         filenames_by_frame_index = render_data["filenames_by_frame_index"]
 
         layer_id = layer["layer_id"]
-        george_script_lines = [
-            f"tv_layerset {layer_id}",
-            "tv_SaveMode \"PNG\""
-        ]
-
-        filepaths_by_frame = {}
+        filepaths_by_frame = FilepathsByFrame(
+            frame_references, filenames_by_frame_index, output_dir
+        )
+        george_script_lines = []
         frames_to_render = []
-        rendered_filepaths = set()
-        for frame_idx, ref_idx in frame_references.items():
-            # None reference is skipped because does not have source
-            if ref_idx is None:
-                filepaths_by_frame[frame_idx] = None
-                continue
-            filename = filenames_by_frame_index[frame_idx]
-            dst_path = "/".join([output_dir, filename])
-            filepaths_by_frame[frame_idx] = dst_path
-            if frame_idx != ref_idx:
-                continue
+        cached_frames = []
+        # Exported paths of frames which should be added to cache
+        export_filepaths = {}
+        # Paths where exposure frames are available after export
+        source_filepaths = {}
+        # Paths where exposure frames should be exported by TVPaint
+        render_filepaths = {}
+        for frame_idx in sorted(frame_references.get_frames_to_render()):
+            export_path = filepaths_by_frame[frame_idx]
+            if layer_render_cache is not None:
+                cached_path = layer_render_cache.get_filepath(
+                    layer_id, frame_idx
+                )
+                if cached_path:
+                    cached_frames.append(str(frame_idx))
+                    source_filepaths[frame_idx] = cached_path
+                    continue
+                export_path = layer_render_cache.get_export_filepath(
+                    layer_id, frame_idx, ext
+                )
+                export_filepaths[frame_idx] = export_path
+
+            source_filepaths[frame_idx] = export_path
+            render_filepaths[frame_idx] = export_path
 
             frames_to_render.append(str(frame_idx))
-            rendered_filepaths.add(dst_path)
             # Go to frame
             george_script_lines.append(f"tv_layerImage {frame_idx}")
             # Store image to output
-            george_script_lines.append(f"tv_saveimage \"{dst_path}\"")
+            george_script_lines.append(f"tv_saveimage \"{export_path}\"")
 
-        self.log.debug("Rendering Exposure frames {} of layer {} ({})".format(
-            ",".join(frames_to_render), layer_id, layer["name"]
-        ))
-        # Let TVPaint render layer's image
-        execute_george_through_file("\n".join(george_script_lines))
+        if cached_frames:
+            self.log.debug(
+                "Using already exported frames {} of layer {} ({})".format(
+                    ",".join(cached_frames), layer_id, layer["name"]
+                )
+            )
 
-        # Apply layer opacity
-        if transparency != 1.0:
-            for filepath in rendered_filepaths:
-                img = Image.open(filepath)
-                r, g, b, a = img.split()
-                a = a.point(lambda i: i * transparency)
-                img = Image.merge("RGBA", (r, g, b, a))
-                img.save(filepath)
+        if frames_to_render:
+            self.log.debug(
+                "Rendering Exposure frames {} of layer {} ({})".format(
+                    ",".join(frames_to_render), layer_id, layer["name"]
+                )
+            )
+
+        return {
+            "layer_id": layer_id,
+            "george_script_lines": george_script_lines,
+            "frame_references": frame_references,
+            "filenames_by_frame_index": filenames_by_frame_index,
+            "filepaths_by_frame": filepaths_by_frame,
+            "export_filepaths": export_filepaths,
+            "source_filepaths": source_filepaths,
+            "render_filepaths": render_filepaths,
+            "alpha_bboxes": {},
+        }
+
+    def _finish_layer_export(
+        self,
+        layer_export: dict[str, Any],
+        output_dir: str,
+        image_cache: DecodedImageCache,
+        layer_render_cache: Optional[LayerRenderCache] = None,
+    ):
+        layer_id = layer_export["layer_id"]
+        frame_references = layer_export["frame_references"]
+        filepaths_by_frame = layer_export["filepaths_by_frame"]
+        source_filepaths = layer_export["source_filepaths"]
+        # Fully transparent exposures are not used for compositing and
+        #   only region with visible pixels is composited from the others
+        alpha_bboxes = layer_export["alpha_bboxes"]
+        empty_frames = set()
+
+        # Stripes are read from memory-mapped store
+        if self.use_frame_store or self.stripe_height > 0:
+            # Held frames are only references to exposures in the store
+            frame_store = LayerFrameStore(
+                os.path.join(output_dir, f"layer_{layer_id}.rgba"),
+                frame_references,
+            )
+            for frame_idx, src_path in sorted(source_filepaths.items()):
+                alpha_bbox = frame_store.add_exposure(frame_idx, src_path)
+                if alpha_bbox is None:
+                    empty_frames.add(frame_idx)
+                else:
+                    alpha_bboxes[frame_idx] = alpha_bbox
+                # Frames exported without cache are in output directory
+                if src_path == filepaths_by_frame[frame_idx]:
+                    os.remove(src_path)
+            if empty_frames:
+                self._log_empty_frames(layer_id, empty_frames)
+                frame_store.remove_references(empty_frames)
+            return frame_store
+
+        # Decoded pixels are kept in image cache for compositing
+        for frame_idx, src_path in source_filepaths.items():
+            if layer_render_cache is not None:
+                alpha_bbox = layer_render_cache.get_alpha_bbox(
+                    layer_id, frame_idx, src_path, image_cache
+                )
+            else:
+                alpha_bbox = get_pixels_alpha_bbox(
+                    image_cache.get_pixels((layer_id, frame_idx), src_path)
+                )
+            if alpha_bbox is None:
+                empty_frames.add(frame_idx)
+            else:
+                alpha_bboxes[frame_idx] = alpha_bbox
+
+        if empty_frames:
+            self._log_empty_frames(layer_id, empty_frames)
+            for frame_idx in empty_frames:
+                image_cache.discard((layer_id, frame_idx))
+                src_path = source_filepaths.pop(frame_idx)
+                # Frames exported without cache are in output directory
+                if src_path == filepaths_by_frame[frame_idx]:
+                    os.remove(src_path)
+            frame_references = frame_references.without_references(
+                empty_frames
+            )
+            filepaths_by_frame = FilepathsByFrame(
+                frame_references,
+                layer_export["filenames_by_frame_index"],
+                output_dir,
+            )
+
+        for frame_idx, src_path in source_filepaths.items():
+            dst_path = filepaths_by_frame[frame_idx]
+            if src_path != dst_path:
+                copy_render_file(src_path, dst_path)
 
         # Fill frames between `frame_start_index` and `frame_end_index`
         self.log.debug("Filling frames not rendered frames.")
         fill_reference_frames(frame_references, filepaths_by_frame)
 
         return filepaths_by_frame
+
+    def _log_empty_frames(self, layer_id, empty_frames):
+        self.log.debug(
+            "Skipping empty exposure frames {} of layer {}".format(
+                ",".join(str(idx) for idx in sorted(empty_frames)),
+                layer_id
+            )
+        )
+
+
+class ExtractSequenceFinish(pyblish.api.InstancePlugin):
+    """Wait for compositing of instance running in background.
+
+    Errors of compositing are raised here so they are shown on the
+    instance which caused them. Representations are added to instance
+    here, in main thread. Compositing of other instances is cancelled
+    when compositing fails.
+    """
+    label = "Extract Sequence (finish)"
+    order = pyblish.api.ExtractorOrder + 0.01
+    hosts = ["tvpaint"]
+    families = ["review", "render"]
+
+    def process(self, instance):
+        future = instance.data.pop("tvpaintPostProcessFuture", None)
+        finish = instance.data.pop("tvpaintPostProcessFinish", None)
+        if future is None:
+            return
+
+        context = instance.context
+        post_process_queue = context.data.get("tvpaintPostProcessQueue")
+        try:
+            composite_result = future.result()
+        except Exception:
+            # Don't let waiting instances write output of failed publish
+            if post_process_queue is not None:
+                post_process_queue.shutdown(wait=False, cancel_futures=True)
+                context.data.pop("tvpaintPostProcessQueue")
+            raise
+
+        # All instances were already submitted by 'ExtractSequence'
+        if (
+            post_process_queue is not None
+            and not post_process_queue.pending
+        ):
+            post_process_queue.shutdown(wait=False)
+            context.data.pop("tvpaintPostProcessQueue")
+
+        if finish is not None:
+            finish(composite_result)
@@ -19,6 +19,9 @@ class TVPaintWorkerCommunicator(BaseCommunicator):
 
     Received jobs are send to TVPaint by parsing 'ProcessTVPaintCommands'.
     """
+    # Workers use default capabilities
+    probe_capabilities_on_connect = False
+
     def __init__(self, server_url):
         super().__init__()
 
@@ -8,6 +8,13 @@ class CollectRenderInstancesModel(BaseSettingsModel):
     )
 
 
+def intermediate_format_enum():
+    return [
+        {"value": "png", "label": "PNG"},
+        {"value": "tga", "label": "TGA (uncompressed)"},
+    ]
+
+
 class ExtractSequenceModel(BaseSettingsModel):
     """Review BG color is used for whole scene review and for thumbnails."""
     review_bg: ColorRGBA_uint8 = SettingsField(
@@ -16,6 +23,138 @@ class ExtractSequenceModel(BaseSettingsModel):
     # review_bg: ColorRGB_uint8 = SettingsField(
     #     (255, 255, 255),
     #     title="Review BG color")
+    image_cache_size: int = SettingsField(
+        512,
+        title="Decoded image cache size (MB)",
+        description=(
+            "Maximum memory used by decoded layer images during compositing."
+            " The size is used by each compositing process."
+        ),
+        ge=0,
+    )
+    prefix_cache_size: int = SettingsField(
+        256,
+        title="Partial composites cache size (MB)",
+        description=(
+            "Maximum memory used by composites of bottom layers shared"
+            " between frames during compositing. The size is used by each"
+            " compositing process."
+        ),
+        ge=0,
+    )
+    composite_workers: int = SettingsField(
+        1,
+        title="Compositing processes",
+        description=(
+            "Number of processes used to composite layers. Compositing runs"
+            " in the publishing process when set to 1. Each additional"
+            " process is spawned as a new Python interpreter from the host"
+            " process and has its own image caches. Number of CPUs is used"
+            " when set to 0."
+        ),
+        ge=0,
+    )
+    intermediate_format: str = SettingsField(
+        "png",
+        title="Layer frames format",
+        description=(
+            "Format of layer frames exported from TVPaint before compositing."
+            " Composited output frames are always PNG."
+        ),
+        enum_resolver=intermediate_format_enum,
+    )
+    use_frame_store: bool = SettingsField(
+        False,
+        title="Store layer frames in memory-mapped files",
+        description=(
+            "Exposures of each layer are stored in single file read by"
+            " compositing instead of file per frame."
+        ),
+    )
+    stripe_height: int = SettingsField(
+        0,
+        title="Compositing stripe height",
+        description=(
+            "Composite frames by horizontal stripes with this number of rows"
+            " to limit memory usage on large resolutions. Layer frames are"
+            " stored in memory-mapped files when enabled. Disabled when set"
+            " to 0."
+        ),
+        ge=0,
+    )
+    background_post_process: bool = SettingsField(
+        False,
+        title="Composite in background",
+        description=(
+            "Composite frames of an instance in background while TVPaint"
+            " exports next instance. Logs of background compositing may be"
+            " shown under other publish plugins."
+        ),
+    )
+    post_process_queue_size: int = SettingsField(
+        2,
+        title="Background queue size",
+        description=(
+            "Maximum number of instances waiting for background compositing."
+        ),
+        ge=1,
+    )
+    adaptive_layer_export: bool = SettingsField(
+        False,
+        title="Adaptive layer export",
+        description=(
+            "Export whole range of layers with dense exposures at once"
+            " with only the layer visible when it is estimated to be faster"
+            " than exporting exposures one by one."
+        ),
+    )
+    range_export_min_density: float = SettingsField(
+        0.5,
+        title="Range export minimum exposure density",
+        description=(
+            "Minimum ratio of exposures to frames of layer to consider"
+            " range export."
+        ),
+        ge=0.0,
+        le=1.0,
+    )
+    incremental_cache: bool = SettingsField(
+        False,
+        title="Reuse frames from previous publish",
+        description=(
+            "Keep composited frames in local cache per workfile and"
+            " instance. Frames with unchanged sources are reused on next"
+            " publish instead of being composited again."
+        ),
+    )
+    incremental_cache_size: int = SettingsField(
+        2048,
+        title="Reused frames cache size (MB)",
+        description=(
+            "Size limit of local cache of composited frames. Caches of"
+            " least recently published instances are removed first."
+        ),
+        ge=0,
+    )
+    resumable_extraction: bool = SettingsField(
+        False,
+        title="Resumable extraction",
+        description=(
+            "Record finished frames in checkpoint manifest in staging"
+            " directory. Publish of unchanged scene continues with"
+            " frames that were not finished by previous failed publish."
+        ),
+    )
+    stream_review: bool = SettingsField(
+        False,
+        title="Stream review to encoder",
+        description=(
+            "Composited frames of render instances with review are piped"
+            " to ffmpeg with review BG color during compositing, so review"
+            " is not encoded from PNG files. Frames are composited in"
+            " single process."
+        ),
+    )
 
 
 class ValidatePluginModel(BaseSettingsModel):
@@ -84,6 +223,27 @@ class ExtractConvertToEXRModel(BaseSettingsModel):
     )
 
 
+class ExtractExposureReviewModel(BaseSettingsModel):
+    """Encode review only from unique frames of PNG sequence.
+
+    Held frames are encoded as longer frames of variable frame rate video
+    instead of being decoded and encoded again.
+    """
+    enabled: bool = False
+    output_tags: list[str] = SettingsField(
+        default_factory=lambda: ["review", "delete"],
+        title="Output tags",
+        description="Tags of created video representation",
+    )
+    crf: int = SettingsField(
+        18,
+        title="CRF",
+        description="Constant rate factor of H.264 encoding",
+        ge=0,
+        le=51,
+    )
+
+
 class LoadImageDefaultModel(BaseSettingsModel):
     _layout = "expanded"
     stretch: bool = SettingsField(title="Stretch")
@@ -119,6 +279,9 @@ class PublishPluginsModel(BaseSettingsModel):
     ExtractConvertToEXR: ExtractConvertToEXRModel = SettingsField(
         default_factory=ExtractConvertToEXRModel,
         title="Extract Convert To EXR")
+    ExtractExposureReview: ExtractExposureReviewModel = SettingsField(
+        default_factory=ExtractExposureReviewModel,
+        title="Extract Exposure Review")
 
 
 class LoadPluginsModel(BaseSettingsModel):
@@ -136,7 +299,21 @@ DEFAULT_PUBLISH_SETTINGS = {
     },
     "ExtractSequence": {
         # "review_bg": [255, 255, 255]
-        "review_bg": [255, 255, 255, 1.0]
+        "review_bg": [255, 255, 255, 1.0],
+        "image_cache_size": 512,
+        "prefix_cache_size": 256,
+        "composite_workers": 1,
+        "intermediate_format": "png",
+        "use_frame_store": False,
+        "stripe_height": 0,
+        "background_post_process": False,
+        "post_process_queue_size": 2,
+        "adaptive_layer_export": False,
+        "range_export_min_density": 0.5,
+        "incremental_cache": False,
+        "incremental_cache_size": 2048,
+        "resumable_extraction": False,
+        "stream_review": False,
     },
     "ValidateProjectSettings": {
         "enabled": True,
@@ -162,5 +339,10 @@ DEFAULT_PUBLISH_SETTINGS = {
         "enabled": False,
         "replace_pngs": True,
         "exr_compression": "ZIP"
+    },
+    "ExtractExposureReview": {
+        "enabled": False,
+        "output_tags": ["review", "delete"],
+        "crf": 18
     }
 }
@@ -0,0 +1,142 @@
+"""Benchmark of layer compositing with different number of processes.
+
+Composites synthetic layers with held exposures and reports throughput
+for each number of compositing processes. Result is used to choose
+default value of 'composite_workers' setting of 'ExtractSequence'.
+
+Usage:
+    python tests/benchmark_composite.py --workers 1 2 4 0
+
+Number of workers '0' uses number of CPUs, the same as the setting.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import importlib.util
+
+import numpy as np
+from PIL import Image
+
+LIB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "client", "ayon_tvpaint", "lib.py"
+)
+
+# Module is registered so functions can be used in worker processes, module
+#   level code is executed again in spawned processes
+_spec = importlib.util.spec_from_file_location("tvpaint_lib", LIB_PATH)
+lib = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = lib
+_spec.loader.exec_module(lib)
+
+
+def _create_layers(root, layer_count, frame_count, width, height, hold):
+    rng = np.random.default_rng(0)
+    layers_data = []
+    filepaths_by_layer_id = {}
+    frame_references_by_layer_id = {}
+    for layer_id in range(1, layer_count + 1):
+        layers_data.append({"layer_id": layer_id, "position": layer_id})
+        # Layers change on different frames so prefix of sources is shared
+        offset = layer_id % hold
+        runs = []
+        for start in range(-offset, frame_count, hold):
+            runs.append((max(start, 0), min(start + hold, frame_count) - 1))
+        frame_references = lib.FrameReferences([
+            (start, end, start) for start, end in runs
+        ])
+        filepaths_by_frame = {}
+        for start, end in runs:
+            pixels = np.zeros((height, width, 4), dtype=np.uint8)
+            top = int(rng.integers(0, height // 2))
+            left = int(rng.integers(0, width // 2))
+            pixels[top:top + height // 2, left:left + width // 2] = (
+                rng.integers(0, 256, size=4, dtype=np.uint8)
+            )
+            pixels[..., 3] = np.maximum(pixels[..., 3], 1)
+            src_path = os.path.join(
+                root, "layer_{}.{}.png".format(layer_id, start)
+            )
+            Image.fromarray(pixels, "RGBA").save(src_path)
+            for frame_idx in range(start, end + 1):
+                filepaths_by_frame[frame_idx] = src_path
+        filepaths_by_layer_id[layer_id] = filepaths_by_frame
+        frame_references_by_layer_id[layer_id] = frame_references
+    return layers_data, filepaths_by_layer_id, frame_references_by_layer_id
+
+
+def _run(args, workers, layers):
+    layers_data, filepaths_by_layer_id, frame_references_by_layer_id = (
+        layers
+    )
+    durations = []
+    for _ in range(args.repeat):
+        output_dir = tempfile.mkdtemp(prefix="output_", dir=args.root)
+        dst_filepaths_by_frame = {
+            frame_idx: os.path.join(output_dir, "{}.png".format(frame_idx))
+            for frame_idx in range(args.frames)
+        }
+        start_time = time.perf_counter()
+        lib.composite_rendered_layers(
+            layers_data,
+            filepaths_by_layer_id,
+            0,
+            args.frames - 1,
+            dst_filepaths_by_frame,
+            cleanup=False,
+            frame_references_by_layer_id=frame_references_by_layer_id,
+            max_workers=workers,
+        )
+        durations.append(time.perf_counter() - start_time)
+        shutil.rmtree(output_dir)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=96)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument(
+        "--hold", type=int, default=2, help="Duration of exposures."
+    )
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, 0]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="tvp_benchmark_") as root:
+        args.root = root
+        layers = _create_layers(
+            root, args.layers, args.frames, args.width, args.height, args.hold
+        )
+        print(
+            "{} layers, {} frames {}x{}, exposures held for {} frames,"
+            " {} CPUs".format(
+                args.layers, args.frames, args.width, args.height,
+                args.hold, os.cpu_count()
+            )
+        )
+        print("{:>8} {:>10} {:>10} {:>8}".format(
+            "workers", "seconds", "frames/s", "speedup"
+        ))
+        base_duration = None
+        for workers in args.workers:
+            duration = _run(args, workers, layers)
+            if base_duration is None:
+                base_duration = duration
+            print("{:>8} {:>10.2f} {:>10.2f} {:>8.2f}".format(
+                workers or os.cpu_count(),
+                duration,
+                args.frames / duration,
+                base_duration / duration,
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import importlib.util
+
+import pytest
+
+LIB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "client", "ayon_tvpaint", "lib.py"
+)
+
+
+@pytest.fixture(scope="session")
+def lib():
+    """Module 'ayon_tvpaint.lib' loaded directly from file.
+
+    Package 'ayon_tvpaint' requires 'ayon_core' which is not needed to
+    test the library functions.
+    """
+    spec = importlib.util.spec_from_file_location("tvpaint_lib", LIB_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
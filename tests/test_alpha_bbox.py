@@ -0,0 +1,56 @@
+"""Tests of alpha bounding boxes computed from decoded exposures."""
+import numpy as np
+import pytest
+from PIL import Image
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_pixels_bbox_matches_image_bbox(lib, tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    pixels = np.zeros((16, 24, 4), dtype=np.uint8)
+    for _ in range(rng.integers(0, 3)):
+        top, left = rng.integers(0, 16), rng.integers(0, 24)
+        pixels[top, left, 3] = rng.integers(1, 256)
+    filepath = str(tmp_path / "frame.png")
+    Image.fromarray(pixels).save(filepath)
+
+    assert (
+        lib.get_pixels_alpha_bbox(lib.load_image_pixels(filepath))
+        == lib.get_image_alpha_bbox(filepath)
+    )
+
+
+def test_frame_store_skips_empty_exposures(lib, tmp_path):
+    empty_path = str(tmp_path / "empty.png")
+    Image.fromarray(np.zeros((4, 4, 4), dtype=np.uint8)).save(empty_path)
+    pixels = np.zeros((4, 4, 4), dtype=np.uint8)
+    pixels[1:3, 2, 3] = 255
+    visible_path = str(tmp_path / "visible.png")
+    Image.fromarray(pixels).save(visible_path)
+
+    frame_store = lib.LayerFrameStore(
+        str(tmp_path / "layer_1.rgba"),
+        lib.FrameReferences([(0, 1, 0), (2, 3, 2)]),
+    )
+    assert frame_store.add_exposure(0, empty_path) is None
+    assert frame_store.add_exposure(2, visible_path) == (2, 1, 3, 3)
+    frame_store.remove_references([0])
+
+    assert frame_store[0] is None
+    assert frame_store[3].offset == 0
+
+
+def test_layer_render_cache_keeps_decoded_pixels(lib, tmp_path):
+    pixels = np.zeros((4, 4, 4), dtype=np.uint8)
+    pixels[0, 0, 3] = 255
+    filepath = str(tmp_path / "layer_1.0.png")
+    Image.fromarray(pixels).save(filepath)
+
+    image_cache = lib.DecodedImageCache(1)
+    layer_render_cache = lib.LayerRenderCache(str(tmp_path))
+    assert layer_render_cache.get_alpha_bbox(
+        1, 0, filepath, image_cache
+    ) == (0, 0, 1, 1)
+    image_cache.get_pixels((1, 0), filepath)
+
+    assert image_cache.decode_count == 1
@@ -0,0 +1,57 @@
+"""Tests of exposures returned by 'composite_rendered_layers'."""
+import os
+
+import numpy as np
+from PIL import Image
+
+
+def _save_image(filepath, value):
+    pixels = np.zeros((4, 4, 4), dtype=np.uint8)
+    pixels[..., 0] = value
+    pixels[1:, :, 3] = 200
+    Image.fromarray(pixels).save(filepath)
+
+
+def test_exposures_of_held_frames(lib, tmp_path):
+    # Layer 1 changes on frames 0 and 4, layer 2 on frames 0, 2 and 4,
+    #   layer 2 is transparent from frame 6
+    references_by_layer_id = {
+        1: lib.FrameReferences([(0, 3, 0), (4, 7, 4)]),
+        2: lib.FrameReferences(
+            [(0, 1, 0), (2, 3, 2), (4, 5, 4), (6, 7, None)]
+        ),
+    }
+    filepaths_by_layer_id = {}
+    for layer_id, frame_references in references_by_layer_id.items():
+        filepaths_by_frame = {}
+        for frame_idx, ref_idx in frame_references.items():
+            if ref_idx is None:
+                filepaths_by_frame[frame_idx] = None
+                continue
+            filepath = str(
+                tmp_path / "layer_{}.{}.png".format(layer_id, frame_idx)
+            )
+            if frame_idx == ref_idx:
+                _save_image(filepath, layer_id * 10 + frame_idx)
+            else:
+                os.link(filepaths_by_frame[ref_idx], filepath)
+            filepaths_by_frame[frame_idx] = filepath
+        filepaths_by_layer_id[layer_id] = filepaths_by_frame
+
+    dst_filepaths_by_frame = {
+        frame_idx: str(tmp_path / "out.{}.png".format(frame_idx))
+        for frame_idx in range(8)
+    }
+    exposures = lib.composite_rendered_layers(
+        [
+            {"layer_id": 1, "position": 1},
+            {"layer_id": 2, "position": 0},
+        ],
+        filepaths_by_layer_id,
+        0,
+        7,
+        dst_filepaths_by_frame,
+        frame_references_by_layer_id=references_by_layer_id,
+        skip_frames={3},
+    )
+    assert exposures == [(0, 2), (2, 1), (3, 1), (4, 2), (6, 2)]
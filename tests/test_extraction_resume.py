@@ -0,0 +1,187 @@
+"""Tests of extraction resumed from checkpoint in 'ayon_tvpaint.lib'."""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+FRAME_COUNT = 40
+# Patterns of intermediate files used by 'ExtractSequence'
+INTERMEDIATE_PATTERNS = ("pos_*", "layer_*.rgba", "range_*")
+# Exposure frames of layers, frames between them are held
+EXPOSURES_BY_LAYER_ID = {
+    1: [0, 3, 10, 11, 20, 33],
+    2: [0, 5, 6, 18, 30],
+}
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _save_image(filepath, layer_id, frame_idx):
+    pixels = np.zeros((6, 6, 4), dtype=np.uint8)
+    pixels[..., layer_id - 1] = 50 + frame_idx * 5
+    pixels[2:, :, 3] = 120 + layer_id * 50
+    Image.fromarray(pixels).save(filepath)
+
+
+def _extract(lib, output_dir, signature, interrupt=False):
+    """Extract frames in a way 'ExtractSequence' does with checkpoint.
+
+    Layer 1 is filled with hardlinks of held frames and layer 2 is stored
+    in 'LayerFrameStore'.
+
+    Returns:
+        tuple[dict[int, str], set[int]]: Output filepaths by frame and
+            frames which were reused from previous extraction.
+    """
+    checkpoint = lib.ExtractionCheckpoint(output_dir)
+    checkpoint.validate(signature)
+    checkpoint.start_stage("sequence")
+    verified_filenames = checkpoint.get_verified_files("sequence")
+
+    dst_filepaths_by_frame = {
+        frame_idx: os.path.join(output_dir, "{:04}.png".format(frame_idx))
+        for frame_idx in range(FRAME_COUNT)
+    }
+    checkpoint.remove_unrecorded_files(
+        filenames=[
+            os.path.basename(filepath)
+            for filepath in dst_filepaths_by_frame.values()
+        ],
+        patterns=INTERMEDIATE_PATTERNS,
+    )
+    skip_frames = {
+        frame_idx
+        for frame_idx, filepath in dst_filepaths_by_frame.items()
+        if os.path.basename(filepath) in verified_filenames
+    }
+
+    layers_data = []
+    filepaths_by_layer_id = {}
+    frame_references_by_layer_id = {}
+    for position, (layer_id, exposure_frames) in enumerate(
+        EXPOSURES_BY_LAYER_ID.items()
+    ):
+        layers_data.append({"layer_id": layer_id, "position": position})
+        frame_references = lib.calculate_layer_frame_references(
+            0, FRAME_COUNT - 1, 0, FRAME_COUNT - 1,
+            exposure_frames, "none", "none"
+        )
+        frame_references_by_layer_id[layer_id] = frame_references
+        filepaths_by_frame = {
+            frame_idx: os.path.join(
+                output_dir, "pos_{}.{:04}.png".format(position, frame_idx)
+            )
+            for frame_idx in range(FRAME_COUNT)
+        }
+        for frame_idx in exposure_frames:
+            _save_image(filepaths_by_frame[frame_idx], layer_id, frame_idx)
+
+        if layer_id == 1:
+            lib.fill_reference_frames(frame_references, filepaths_by_frame)
+            filepaths_by_layer_id[layer_id] = filepaths_by_frame
+            continue
+
+        frame_store = lib.LayerFrameStore(
+            os.path.join(output_dir, "layer_{}.rgba".format(layer_id)),
+            frame_references,
+        )
+        for frame_idx in exposure_frames:
+            frame_store.add_exposure(frame_idx, filepaths_by_frame[frame_idx])
+            os.remove(filepaths_by_frame[frame_idx])
+        filepaths_by_layer_id[layer_id] = frame_store
+
+    def on_frames_done(filepaths):
+        checkpoint.add_files("sequence", filepaths)
+        if interrupt:
+            raise Interrupted()
+
+    lib.composite_rendered_layers(
+        layers_data,
+        filepaths_by_layer_id,
+        0,
+        FRAME_COUNT - 1,
+        dst_filepaths_by_frame,
+        frame_references_by_layer_id=frame_references_by_layer_id,
+        skip_frames=skip_frames,
+        on_frames_done=on_frames_done,
+    )
+    checkpoint.finish_stage("sequence")
+    return dst_filepaths_by_frame, skip_frames
+
+
+def _read_frames(filepaths_by_frame):
+    return {
+        frame_idx: np.asarray(Image.open(filepath).convert("RGBA"))
+        for frame_idx, filepath in filepaths_by_frame.items()
+    }
+
+
+def test_interrupted_extraction_is_resumed(lib, tmp_path):
+    expected_dir = tmp_path / "expected"
+    output_dir = tmp_path / "output"
+    expected_dir.mkdir()
+    output_dir.mkdir()
+    expected_filepaths, _ = _extract(lib, str(expected_dir), "signature")
+
+    with pytest.raises(Interrupted):
+        _extract(lib, str(output_dir), "signature", interrupt=True)
+    # Intermediate files of interrupted extraction are left in directory
+    leftover_names = set(os.listdir(output_dir))
+    assert any(name.startswith("pos_") for name in leftover_names)
+    assert "layer_2.rgba" in leftover_names
+
+    output_filepaths, skip_frames = _extract(
+        lib, str(output_dir), "signature"
+    )
+    assert skip_frames
+    assert len(skip_frames) < FRAME_COUNT
+
+    expected_frames = _read_frames(expected_filepaths)
+    output_frames = _read_frames(output_filepaths)
+    for frame_idx, pixels in expected_frames.items():
+        np.testing.assert_array_equal(output_frames[frame_idx], pixels)
+
+
+def test_changed_signature_removes_previous_output(lib, tmp_path):
+    _extract(lib, str(tmp_path), "signature")
+    _, skip_frames = _extract(lib, str(tmp_path), "changed")
+    assert not skip_frames
+
+
+def test_files_not_created_by_extraction_are_kept(lib, tmp_path):
+    user_file = tmp_path / "notes.txt"
+    user_file.write_text("keep")
+    user_dir = tmp_path / "references"
+    user_dir.mkdir()
+    (tmp_path / "pos_0.0001.png").write_bytes(b"")
+    (tmp_path / "range_1_abc").mkdir()
+
+    checkpoint = lib.ExtractionCheckpoint(str(tmp_path))
+    checkpoint.validate("signature")
+    checkpoint.remove_unrecorded_files(patterns=INTERMEDIATE_PATTERNS)
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "notes.txt", "references", "tvpaint_checkpoint.json"
+    ]
+
+
+def test_layer_frame_store_truncates_previous_content(lib, tmp_path):
+    src_path = str(tmp_path / "src.png")
+    store_path = str(tmp_path / "layer.rgba")
+    frame_references = lib.FrameReferences([(0, 1, 0)])
+    for frame_idx in (5, 0):
+        _save_image(src_path, 1, frame_idx)
+        frame_store = lib.LayerFrameStore(store_path, frame_references)
+        frame_store.add_exposure(0, src_path)
+
+    expected = np.asarray(Image.open(src_path).convert("RGBA"))
+    store_frame = frame_store[1]
+    assert os.path.getsize(store_path) == expected.nbytes
+    pixels = np.fromfile(
+        store_path, dtype=np.uint8, count=expected.size,
+        offset=store_frame.offset
+    ).reshape(expected.shape)
+    np.testing.assert_array_equal(pixels, expected)
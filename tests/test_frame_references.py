@@ -0,0 +1,102 @@
+"""Tests of frame references calculation in 'ayon_tvpaint.lib'."""
+import random
+
+import pytest
+
+# Unknown behavior is handled as transparent
+BEHAVIORS = ("none", "hold", "repeat", "pingpong", "unknown")
+
+
+def _random_layer(rng, layer_id, position):
+    frame_start = rng.randint(-30, 30)
+    frame_end = frame_start + rng.randint(0, 40)
+    # Exposure frames can be out of layer range and negative
+    exposure_frames = sorted({
+        rng.randint(frame_start - 5, frame_end + 5)
+        for _ in range(rng.randint(0, 8))
+    })
+    layer_data = {
+        "layer_id": layer_id,
+        "position": position,
+        "visible": rng.random() > 0.1,
+        "frame_start": frame_start,
+        "frame_end": frame_end,
+    }
+    behavior = {
+        "pre": rng.choice(BEHAVIORS),
+        "post": rng.choice(BEHAVIORS),
+    }
+    return layer_data, exposure_frames, behavior
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matrix_matches_per_layer_calculation(lib, seed):
+    rng = random.Random(seed)
+    range_start = rng.randint(-40, 10)
+    range_end = range_start + rng.randint(0, 60)
+
+    layers_data = []
+    exposure_frames_by_layer_id = {}
+    behavior_by_layer_id = {}
+    for position in range(rng.randint(1, 6)):
+        layer_id = str(position + 1)
+        layer_data, exposure_frames, behavior = _random_layer(
+            rng, layer_id, position
+        )
+        layers_data.append(layer_data)
+        exposure_frames_by_layer_id[layer_id] = exposure_frames
+        behavior_by_layer_id[layer_id] = behavior
+
+    layer_ids, matrix = lib.calculate_layers_frame_references_matrix(
+        layers_data,
+        exposure_frames_by_layer_id,
+        behavior_by_layer_id,
+        range_start,
+        range_end,
+    )
+    layer_data_by_id = {
+        layer_data["layer_id"]: layer_data
+        for layer_data in layers_data
+    }
+    for layer_id, row in zip(layer_ids, matrix):
+        layer_data = layer_data_by_id[layer_id]
+        behavior = behavior_by_layer_id[layer_id]
+        expected = lib.calculate_layer_frame_references(
+            range_start,
+            range_end,
+            layer_data["frame_start"],
+            layer_data["frame_end"],
+            exposure_frames_by_layer_id[layer_id],
+            behavior["pre"],
+            behavior["post"],
+        )
+        result = lib.FrameReferences.from_array(row, range_start)
+        assert dict(result.items()) == dict(expected.items())
+        assert list(result.iter_runs()) == list(expected.iter_runs())
+
+
+def test_negative_frames_are_not_transparent(lib):
+    layer_ids, matrix = lib.calculate_layers_frame_references_matrix(
+        [{
+            "layer_id": "1",
+            "position": 0,
+            "visible": True,
+            "frame_start": -5,
+            "frame_end": -1,
+        }],
+        {"1": [-5, -3, -1]},
+        {"1": {"pre": "none", "post": "none"}},
+        -5,
+        2,
+    )
+    references = lib.FrameReferences.from_array(matrix[0], -5)
+    assert dict(references.items()) == {
+        -5: -5,
+        -4: -5,
+        -3: -3,
+        -2: -3,
+        -1: -1,
+        0: None,
+        1: None,
+        2: None,
+    }
@@ -0,0 +1,29 @@
+"""Tests of 'LayerExportStrategy' in 'ayon_tvpaint.lib'."""
+import pytest
+
+
+def test_range_estimates_are_fitted(lib):
+    strategy = lib.LayerExportStrategy()
+    layer_seconds = 2.0
+    frame_seconds = 0.01
+    for _ in range(10):
+        for layer_count, frame_count in ((1, 100), (3, 120), (2, 400)):
+            strategy.record_range(
+                layer_count,
+                frame_count,
+                layer_count * layer_seconds + frame_count * frame_seconds
+            )
+
+    assert strategy._range_layer_seconds == pytest.approx(layer_seconds)
+    assert strategy._range_frame_seconds == pytest.approx(frame_seconds)
+
+
+def test_range_layer_estimate_kept_without_variance(lib):
+    strategy = lib.LayerExportStrategy()
+    for _ in range(3):
+        strategy.record_range(1, 100, 1.5)
+
+    assert strategy._range_layer_seconds == pytest.approx(
+        strategy.default_range_layer_seconds
+    )
+    assert strategy._range_frame_seconds > 0.0